@@ -0,0 +1,33 @@
+### Microbenchmark of VegaSmtLibParser: per-assertion parse cost on deep and/or nests
+### Usage: python3 tests/bench_smtlib_parser.py [repeat]
+import sys
+import timeit
+
+from vega.smtlib.vega.VegaSmtLibParser import VegaSmtLibParser
+
+def nested_assertion(depth, width):
+    expr = "(= x0 a)"
+    for i in range(depth):
+        op = "and" if i % 2 == 0 else "or"
+        leaves = ' '.join(["(= x{} {})".format(j, "abc"[j % 3]) for j in range(1, width)])
+        expr = "({} {} {})".format(op, expr, leaves)
+    return "(assert {})".format(expr)
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+
+    parser = VegaSmtLibParser()
+    parser.parse_command("(declare-datatypes () ((Any (a) (b) (c))))")
+    for i in range(8):
+        parser.parse_command("(declare-fun x{} () Any)".format(i))
+
+    print("depth  width  tokens  usec/assertion  usec/token")
+    for width in [2, 8]:
+        for depth in [10, 50, 100, 200, 400]:
+            line = nested_assertion(depth, width)
+            tokens = line.count('(') + line.count(')') + len(line.replace('(', ' ').replace(')', ' ').split())
+            t = timeit.timeit(lambda: parser.parse_command(line), number=repeat) / repeat * 1e6
+            print("{:5d}  {:5d}  {:6d}  {:14.1f}  {:10.3f}".format(depth, width, tokens, t, t / tokens))
+
+if __name__ == "__main__":
+    main()
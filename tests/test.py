@@ -1,4 +1,5 @@
 import unittest
+import unittest.mock
 
 from vega import *
 
@@ -25,6 +26,41 @@ class TestGlobalFunctions(unittest.TestCase):
         self.assertEqual(is_expr(1), False)
 
 
+class TestInterning(unittest.TestCase):
+    def test_identical_nodes_are_shared(self):
+        print("\n[*] Interned AST nodes")
+        self.assertIs(Value('Int'), Int)
+        self.assertIs(Variable('x', Any), x)
+        self.assertIs(Not(Eq(x, Int)), Not(Eq(x, Int)))
+        self.assertIs(And(Eq(x, Int), Or(Eq(y, Pointer))), And(Eq(x, Int), Or(Eq(y, Pointer))))
+        self.assertIs(If(Eq(x, Int), Eq(y, Int), Eq(y, Pointer)), If(Eq(x, Int), Eq(y, Int), Eq(y, Pointer)))
+        self.assertIsNot(And(Eq(x, Int), comment="a"), And(Eq(x, Int), comment="b"))
+        self.assertNotEqual(Eq(x, Int), Eq(y, Int))
+
+    def test_variables_of_distinct_sorts(self):
+        print("\n[*] Variables with same name of distinct sorts are not shared")
+        self.assertIs(Sort('Any', [Int, Pointer, PointerOffset]), Any)
+        other = Sort('Any', [Value('a'), Value('b')])
+        self.assertIsNot(Variable('x', other), x)
+        self.assertIs(Variable('x', other).sort, other)
+
+    def test_cached_variables(self):
+        print("\n[*] Cached getVariables() / getConditionVariables()")
+        expr = And(Eq(x, Int), Or(Eq(y, Pointer), Not(Eq(x, Int))), Implies(Eq(z, Int), Eq(y, Int)))
+        self.assertIsInstance(expr.getVariables(), frozenset)
+        self.assertIs(expr.getVariables(), expr.getVariables())
+        self.assertEqual(expr.getVariables(), set([x, y, z]))
+        self.assertEqual(expr.getConditionVariables(), set([z]))
+        self.assertEqual(expr.getConditionVariables(True), set([x, y, z]))
+        self.assertIs(Not(Eq(x, Int)).getVariables(), x.getVariables())
+
+    def test_pickle(self):
+        print("\n[*] Interned AST nodes survive pickle")
+        import pickle
+        expr = Implies(Not(Eq(x, Int)), Eq(w, Int))
+        self.assertIs(pickle.loads(pickle.dumps(expr)), expr)
+
+
 class TestNotAndOr(unittest.TestCase):
     def test_Not(self):
         print("\n[*] x != Int")
@@ -246,6 +282,32 @@ class TestEquality(unittest.TestCase):
         self.assertEqual(m[y], set([Int]))
         self.assertEqual(m[z], set([Int]))
 
+    def test_join_constrained_roots(self):
+        print("\n[*] Test join of constrained trees: z == Int, x == y, x == z")
+        s = Solver(Any)
+        s.add(And(
+            Eq(z, Int),
+            Eq(x, y),
+            Eq(x, z),
+        ))
+        m = s.model()
+        print(m)
+        self.assertEqual(m.sat, sat)
+        self.assertEqual(m[x], set([Int]))
+        self.assertEqual(m[y], set([Int]))
+        self.assertEqual(m[z], set([Int]))
+
+    def test_long_equality_chain(self):
+        print("\n[*] Test long equality chain: v0 == v1, ..., v4999 == v5000, v5000 == Pointer")
+        v = [Variable('v{}'.format(i), Any) for i in range(5001)]
+        s = Solver(Any)
+        s.add(*[Eq(v[i], v[i + 1]) for i in range(5000)])
+        s.add(Eq(v[5000], Pointer))
+        m = s.model()
+        self.assertEqual(m.sat, sat)
+        self.assertEqual(m[v[0]], set([Pointer]))
+        self.assertEqual(s.ref.getRef(v[0]), s.ref.getRef(v[5000]))
+
     def test_join_another_sort(self):
         print("\n[*] Test Eq join with another sort: y == x, y == w")
         s = Solver(Any)
@@ -266,6 +328,703 @@ class TestEquality(unittest.TestCase):
         self.assertEqual(m[y], set(w.sort.values))
         self.assertEqual(m[w], set(w.sort.values))
 
+    def test_sort_domain(self):
+        print("\n[*] Variables of narrower sort start with values of the sort: w == Pointer")
+        for engine in [Domain.SetDomain, Domain.BitsetDomain]:
+            s = Solver(Any, Feature(engine=engine))
+            v = Variable('v', S)
+            s.declareVariable(w)
+            s.declareVariable(v)
+            self.assertEqual(s.post_constraints, []) # No restriction constraints
+            self.assertIs(s.variables[w], s.variables[v]) # Shared by variables of same sort
+            self.assertEqual(s.model()[w], set([Int]))
+            s.add(Eq(w, Pointer))
+            self.assertEqual(s.propagate(), unsat)
+
+
+class TestBitsetDomain(unittest.TestCase):
+    def test_engine(self):
+        print("\n[*] BitsetDomain operations")
+        e = Domain.BitsetDomain(Any)
+        d = e.remove(e.full(), Int)
+        self.assertEqual(e.values(d), Any.values - set([Int]))
+        self.assertEqual(e.contains(d, Int), False)
+        self.assertEqual(e.values(e.intersect(d, e.of([Int, Pointer]))), set([Pointer]))
+        self.assertEqual(e.values(e.add(e.blank(), PointerOffset)), set([PointerOffset]))
+        self.assertEqual(e.size(e.full()), len(Any.values))
+
+    def test_And_Or_and_Not_Eq(self):
+        print("\n[*] BitsetDomain: And(Or(x == Pointer, x == PointerOffset), x != Int, y == x)")
+        s = Solver(Any, Feature(engine=Domain.BitsetDomain))
+        s.add(And(
+            Or(
+                Eq(x, PointerOffset),
+                Eq(x, Pointer),
+            ),
+            Not(Eq(x, Int)),
+            Eq(y, x),
+        ))
+        m = s.model()
+        print(m)
+        self.assertEqual(m.sat, sat)
+        self.assertEqual(m[x], set([PointerOffset, Pointer]))
+        self.assertEqual(m[y], set([PointerOffset, Pointer]))
+
+    def test_contradiction(self):
+        print("\n[*] BitsetDomain: x == {Int}, y == {Pointer}, x == y")
+        s = Solver(Any, Feature(engine=Domain.BitsetDomain))
+        s.add(And(
+            Eq(x, Int),
+            Eq(y, Pointer),
+            Eq(x, y)
+        ))
+        self.assertEqual(s.check(), unsat)
+
+    def test_abstract_engine(self):
+        print("\n[*] DomainEngine cannot be instantiated without all operations")
+        self.assertRaises(TypeError, Domain.DomainEngine, Any)
+        class PartialDomain(Domain.DomainEngine):
+            def full(self):
+                return 0
+        self.assertRaises(TypeError, PartialDomain, Any)
+
+    def test_value_out_of_sort(self):
+        print("\n[*] Both engines raise ValueError on value out of sort")
+        other = Value('Other')
+        for e in (Domain.SetDomain(Any), Domain.BitsetDomain(Any)):
+            self.assertRaises(ValueError, e.of, [Int, other])
+            self.assertRaises(ValueError, e.add, e.blank(), other)
+            self.assertRaises(ValueError, e.remove, e.full(), other)
+            self.assertEqual(e.contains(e.full(), other), False)
+
+
+class TestIncremental(unittest.TestCase):
+    def test_propagate(self):
+        print("\n[*] Evaluate constraints as they are added: x == Int; Implies(x == Int, y == Int)")
+        s = Solver(Any)
+        s.add(Eq(x, Int))
+        self.assertEqual(s.propagate(), sat)
+        s.add(Implies(Eq(x, Int), Eq(y, Int)))
+        self.assertEqual(s.propagate(), sat)
+        m = s.model()
+        print(m)
+        self.assertEqual(m.sat, sat)
+        self.assertEqual(m[x], set([Int]))
+        self.assertEqual(m[y], set([Int]))
+
+    def test_propagate_unsat(self):
+        print("\n[*] Propagation detects unsat before check(): x == Int; x != Int")
+        s = Solver(Any)
+        s.add(Eq(x, Int))
+        s.add(Not(Eq(x, Int)))
+        self.assertEqual(s.propagate(), unsat)
+        s.add(Eq(y, Int))
+        self.assertEqual(s.propagate(), unsat)
+        self.assertEqual(s.check(), unsat)
+    def test_dirty_post_constraints(self):
+        print("\n[*] Only post-constraints of which variables are changed are evaluated again")
+        v = Variable('v', Any)
+        s = Solver(Any)
+        s.add(Not(Eq(x, Int)), If(Eq(x, Int), Eq(y, Int), Eq(y, Pointer)), If(Eq(z, Int), Eq(v, Int), Eq(y, Pointer)))
+        with unittest.mock.patch.object(Solver, '_Solver__evaluate_post_constraint', autospec=True, side_effect=Solver._Solver__evaluate_post_constraint) as evaluate:
+            self.assertEqual(s.check(), sat)
+            self.assertEqual(evaluate.call_count, 2)
+            s.add(Not(Eq(x, Pointer))) # Same component
+            self.assertEqual(s.check(), sat)
+            self.assertEqual(evaluate.call_count, 3)
+        m = s.model()
+        self.assertEqual(m[x], set([PointerOffset]))
+        self.assertEqual(m[y], set([Pointer]))
+        self.assertEqual(m[v], set([Int]))
+
+
+class TestPushPop(unittest.TestCase):
+    def test_pop_restores_model(self):
+        print("\n[*] push(); x == y, y == Pointer; pop() restores x == Int")
+        s = Solver(Any)
+        s.add(Or(Eq(x, Int), Eq(x, Pointer)))
+        s.add(Not(Eq(x, Pointer)))
+        self.assertEqual(s.check(), sat)
+        s.push()
+        s.add(Eq(x, y), Eq(y, Pointer))
+        self.assertEqual(s.check(), unsat)
+        s.pop()
+        self.assertEqual(s.check(), sat)
+        m = s.model()
+        print(m)
+        self.assertEqual(m[x], set([Int]))
+        self.assertEqual(m[y], None)
+        self.assertNotEqual(s.ref.getRef(x), s.ref.getRef(y))
+
+    def test_nested_scopes(self):
+        print("\n[*] Nested scopes: push(); x == y; push(); y == z, z == Int; pop(); pop()")
+        s = Solver(Any)
+        s.push()
+        s.add(Eq(x, y))
+        s.push()
+        s.push() # Empty scope
+        s.pop()
+        s.add(Eq(y, z), Eq(z, Int))
+        m = s.model()
+        self.assertEqual(m[x], set([Int]))
+        s.pop()
+        self.assertEqual(s.check(), sat)
+        self.assertEqual(s.model()[x], set(Any.values))
+        self.assertEqual(s.model()[z], None)
+        self.assertEqual(s.ref.getRef(x), s.ref.getRef(y))
+        s.pop()
+        self.assertEqual(s.ref.getRef(x), x)
+        self.assertEqual(s.variables, {})
+        self.assertEqual(s.constraints, [])
+        from vega.Exceptions import ExecutionError
+        self.assertRaises(ExecutionError, s.pop)
+
+    def test_smtlib_push_pop(self):
+        print("\n[*] SMT-LIB (push) and (pop)")
+        import io
+        import contextlib
+        from vega.smtlib.app import evaluate_smt2_file
+        script = """(declare-datatypes () ((Any (a) (b) (c))))
+(declare-fun x () Any)
+(assert (or (= x a) (= x b)))
+(push 1)
+(assert (not (= x a)))
+(check-sat)
+(get-model)
+(pop 1)
+(push)
+(assert (not (= x b)))
+(get-model)
+(pop)
+"""
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            evaluate_smt2_file(io.StringIO(script), False)
+        self.assertEqual(out.getvalue(), "sat\n(model\n  (define-fun x () Any\n    (as b Any))\n)\n(model\n  (define-fun x () Any\n    (as a Any))\n)\n")
+
+
+class TestSnapshot(unittest.TestCase):
+    def test_restore(self):
+        print("\n[*] Restore solved prefix x == y, Or(y == Int, y == Pointer) for suffixes")
+        s = Solver(Any)
+        s.add(Eq(x, y), Or(Eq(y, Int), Eq(y, Pointer)))
+        self.assertEqual(s.check(), sat)
+        snapshot = s.snapshot()
+        print(snapshot)
+
+        s.add(Not(Eq(x, Int)))
+        self.assertEqual(s.model()[y], set([Pointer]))
+        s.restore(snapshot)
+        self.assertEqual(s.model_start, 2) # Prefix is not evaluated again
+        s.add(Not(Eq(x, Pointer)))
+        self.assertEqual(s.model()[y], set([Int]))
+        s.restore(snapshot)
+        s.add(Eq(y, PointerOffset))
+        self.assertEqual(s.check(), unsat)
+        s.restore(snapshot)
+        self.assertEqual(s.check(), sat)
+        self.assertEqual(s.model()[x], set([Int, Pointer]))
+
+    def test_fork(self):
+        print("\n[*] Forked solvers do not affect each other")
+        s = Solver(Any)
+        s.add(Or(Eq(x, Int), Eq(x, Pointer)))
+        s.push()
+        s.add(Eq(x, z))
+        t = s.fork()
+        t.add(Eq(x, y), Eq(y, Int))
+        s.add(Eq(x, Pointer))
+        self.assertEqual(t.model()[z], set([Int]))
+        self.assertEqual(s.model()[z], set([Pointer]))
+        self.assertNotEqual(s.ref.getRef(y), s.ref.getRef(x))
+        t.pop()
+        self.assertEqual(t.model()[x], set([Int, Pointer]))
+        self.assertEqual(s.model()[x], set([Pointer]))
+
+
+class TestPartition(unittest.TestCase):
+    def test_components(self):
+        print("\n[*] Constraints are partitioned into components: {x, y} and {z}")
+        s = Solver(Any)
+        s.add(Implies(Eq(x, Int), Eq(y, Pointer)), Eq(x, Int))
+        s.add(Implies(Eq(z, Int), Eq(z, Int)))
+        self.assertEqual(s.propagate(), sat) # Adds post-constraints
+        partition = s.partition
+        print(partition)
+        self.assertIs(partition.getRoot([x]), partition.getRoot([y]))
+        self.assertIsNot(partition.getRoot([x]), partition.getRoot([z]))
+        self.assertEqual(len(partition.getDirtyComponents()), 2)
+        m = s.model()
+        self.assertEqual(m[y], set([Pointer]))
+        self.assertEqual(partition.getDirtyComponents(), [])
+
+    def test_resolve_touched_components(self):
+        print("\n[*] add() makes only touched components dirty")
+        s = Solver(Any)
+        s.add(Implies(Eq(x, Int), Eq(y, Pointer)), Implies(Eq(z, Int), Eq(z, Int)))
+        self.assertEqual(s.check(), sat)
+        s.add(Eq(y, x))
+        dirty = s.partition.getDirtyComponents()
+        self.assertEqual(len(dirty), 1)
+        self.assertEqual(dirty[0][0], s.partition.getRoot([x]))
+        self.assertEqual(s.check(), unsat)
+
+    def test_merge_components(self):
+        print("\n[*] Components joined by Eq(x, z) are solved as one component")
+        s = Solver(Any)
+        s.add(Not(Eq(x, Int)), Implies(Eq(x, Int), Eq(y, Pointer)))
+        s.add(Implies(Eq(z, Pointer), Eq(w, Int)))
+        self.assertEqual(s.check(), sat)
+        s.push()
+        s.add(Eq(x, z))
+        self.assertEqual(s.propagate(), sat)
+        self.assertEqual(len(s.partition.getDirtyComponents()), 1)
+        m = s.model()
+        print(m)
+        self.assertEqual(m[x], set([Pointer]))
+        self.assertEqual(m[w], set([Int]))
+        self.assertEqual(m[y], set(Any.values))
+        s.pop()
+        self.assertIsNot(s.partition.getRoot([x]), s.partition.getRoot([z]))
+        self.assertEqual(s.partition.getDirtyComponents(), [])
+        self.assertEqual(s.check(), sat)
+
+    def test_restore(self):
+        print("\n[*] Partition is rebuilt after restore()")
+        s = Solver(Any)
+        s.add(Implies(Eq(x, Int), Eq(y, Pointer)))
+        snapshot = s.snapshot()
+        s.add(Eq(x, Int))
+        self.assertEqual(s.model()[y], set([Pointer]))
+        s.restore(snapshot)
+        s.add(Eq(x, Pointer))
+        self.assertEqual(s.model()[y], set(Any.values))
+
+    def test_restore_unsat(self):
+        print("\n[*] Restored or forked unsat solver stays unsat after add()")
+        s = Solver(Any)
+        s.add(Implies(Eq(x, Int), Or(Eq(x, Pointer))), Eq(x, Int))
+        self.assertEqual(s.check(), unsat)
+        t = s.fork()
+        t.add(Eq(y, Int))
+        self.assertEqual(t.check(), unsat)
+        snapshot = s.snapshot()
+        s.restore(snapshot)
+        s.add(Eq(y, Int))
+        self.assertEqual(s.check(), unsat)
+
+    def test_unsat_component_order(self):
+        print("\n[*] Verdict does not depend on whether unsat component {x} is solved before or after sat component {y, z}")
+        sat_constraints = [Implies(Eq(z, Int), Eq(y, Pointer)), Eq(z, Int)]
+        unsat_constraints = [Eq(x, Pointer), Implies(Eq(x, Pointer), Eq(x, Int))]
+        for constraints in (sat_constraints + unsat_constraints, unsat_constraints + sat_constraints):
+            for feature in (Feature(), Feature(tactic=Tactic.Simple()), Feature(parallel=2)):
+                s = Solver(Any, feature)
+                s.add(*constraints)
+                self.assertEqual(s.check(), unsat)
+                self.assertIn(s.partition.getRoot([x]), [root for root, _ in s.partition.getDirtyComponents()]) # Unsat component is not marked as solved
+
+
+class TestParallel(unittest.TestCase):
+    def build(self, parallel):
+        s = Solver(Any, Feature(parallel=parallel))
+        v = [Variable('p{}'.format(i), Any) for i in range(12)]
+        for i in range(0, len(v), 3):
+            a, b, c = v[i:i + 3]
+            s.add(Not(Eq(a, PointerOffset)), Implies(Eq(a, Int), Eq(b, Pointer)), Eq(c, b))
+            s.add(If(Eq(c, Pointer), Eq(a, Int), Or(Eq(a, Pointer), Eq(b, Int))))
+        return s, v
+
+    def test_parallel(self):
+        print("\n[*] Components solved by worker processes are merged into one model")
+        s1, v = self.build(1)
+        s2, _ = self.build(2)
+        m1, m2 = s1.model(), s2.model()
+        print(m2)
+        self.assertEqual(m1.sat, m2.sat)
+        for var in v:
+            self.assertEqual(m1[var], m2[var])
+        s1.add(Eq(v[0], Pointer))
+        s2.add(Eq(v[0], Pointer))
+        self.assertEqual(s1.model()[v[1]], s2.model()[v[1]])
+
+    def test_parallel_unsat(self):
+        print("\n[*] Unsat component found by worker process makes whole constraints unsat")
+        s, v = self.build(2)
+        s.add(Implies(Eq(v[3], Int), Eq(v[3], Pointer)), Eq(v[3], Int))
+        self.assertEqual(s.check(), unsat)
+
+    def test_parallel_post_signatures(self):
+        print("\n[*] Post-constraints solved by worker processes are not evaluated again while their variables are not changed")
+        from vega import Parallel
+        for start_methods in (['fork', 'spawn'], ['spawn']): # Forked workers and workers receiving components in binary format
+            with unittest.mock.patch.object(Parallel.multiprocessing, 'get_all_start_methods', return_value=start_methods):
+                s, v = self.build(2)
+                self.assertEqual(s.check(), sat)
+            with unittest.mock.patch.object(Solver, '_Solver__evaluate_post_constraint', autospec=True, side_effect=Solver._Solver__evaluate_post_constraint) as evaluate:
+                s.add(Or(Eq(v[0], Int), Eq(v[0], Pointer))) # Does not change domain of v[0]
+                self.assertEqual(len(s.partition.getDirtyComponents()), 1)
+                self.assertEqual(s.check(), sat)
+                self.assertEqual(evaluate.call_count, 0)
+
+    def test_solve_component_feature(self):
+        print("\n[*] Worker solves component with same feature as solver except for parallel")
+        import sys
+        from vega import Parallel
+        s, v = self.build(2)
+        s.feature = Feature(parallel=2, arc_consistency=True, simplify=False, deduplicate=False)
+        s.propagate()
+        data = s.dumpComponent(v[:3], s.post_constraints[:2])
+        with unittest.mock.patch.object(sys.modules['vega.Solver'], 'Solver', wraps=Solver) as solver:
+            Parallel.solve_component(s.feature, data)
+        feature = solver.call_args[0][1]
+        self.assertEqual(repr(feature), repr(Feature(arc_consistency=True, simplify=False, deduplicate=False)))
+        self.assertEqual(s.feature.parallel, 2)
+
+    def test_smtlib_parallel(self):
+        print("\n[*] SMT-LIB script is solved with worker processes (vega --parallel N)")
+        import io
+        import re
+        import contextlib
+        from vega.smtlib.app import evaluate_smt2_file
+        script = """(declare-datatypes () ((Any (a) (b) (c))))
+(declare-fun x () Any)
+(declare-fun y () Any)
+(assert (=> (= x a) (= y b)))
+(assert (not (= y a)))
+(declare-fun z () Any)
+(assert (=> (= z b) (= z b)))
+(assert (not (= z a)))
+(check-sat)
+(get-model)
+"""
+        outputs = []
+        for parallel in [1, 2]:
+            out = io.StringIO()
+            with unittest.mock.patch.object(Solver, '_Solver__solveComponentsInParallel', autospec=True, side_effect=Solver._Solver__solveComponentsInParallel) as solve:
+                with contextlib.redirect_stdout(out):
+                    evaluate_smt2_file(io.StringIO(script), False, parallel=parallel)
+            self.assertEqual(solve.call_count, parallel - 1)
+            outputs.append(re.sub(r"\(or ([^)]*)\)", lambda m: " ".join(sorted(m.group(1).split())), out.getvalue())) # Order of values is not fixed
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertTrue(outputs[0].startswith("sat\n"))
+
+    def test_component(self):
+        print("\n[*] dump_component() and load_component() round trip")
+        from vega import BinaryFormat
+        s = Solver(Any)
+        s.add(Eq(x, y), Not(Eq(x, Int)), Implies(Eq(z, Int), Eq(y, Pointer)))
+        m = s.model()
+        data = s.dumpComponent([x, y, z], s.post_constraints)
+        model, post_constraints, visited_variables, solved_post_constraints = BinaryFormat.load_component(data)
+        for v in [x, y, z]:
+            self.assertEqual(model[v], m[v])
+        self.assertEqual(model.ref.getRef(x), model.ref.getRef(y))
+        self.assertEqual(post_constraints, s.post_constraints)
+        self.assertEqual(solved_post_constraints, [])
+
+
+class TestArcConsistency(unittest.TestCase):
+    def test_implies(self):
+        print("\n[*] Arc consistency does not revise Implies(x == Int, y == Pointer) (condition clause is assumed true as without it)")
+        for feature in (Feature(), Feature(arc_consistency=True)):
+            s = Solver(Any, feature)
+            s.add(Implies(Eq(x, Int), Eq(y, Pointer)), Not(Eq(y, Pointer)))
+            self.assertEqual(s.check(), unsat)
+            s = Solver(Any, feature)
+            s.add(Implies(Eq(x, Int), Eq(y, Pointer)), Not(Eq(x, Int)))
+            m = s.model()
+            self.assertEqual(m.sat, sat)
+            self.assertEqual(m[y], set(Any.values))
+
+    def test_unsat(self):
+        print("\n[*] Arc consistency finds unsat before constraints are evaluated")
+        s = Solver(Any, Feature(arc_consistency=True))
+        s.add(Implies(Eq(z, Int), Eq(z, Pointer)))
+        s.add(Eq(x, y), Or(Eq(y, Int), Eq(y, Pointer)), Not(Eq(x, Int)), Not(Eq(x, Pointer)))
+        self.assertEqual(s.check(), unsat)
+        self.assertEqual(s.post_constraints, []) # Implies() is not evaluated
+
+    def test_sort(self):
+        print("\n[*] Arc consistency prunes values out of sort of variable")
+        s = Solver(Any, Feature(arc_consistency=True))
+        s.add(Or(Eq(w, Int), Eq(x, Pointer)))
+        s.add(Implies(Eq(x, Int), Eq(w, Pointer)))
+        m = s.model()
+        self.assertEqual(m.sat, sat)
+        self.assertEqual(m[w], set([Int]))
+        self.assertNotIn(Int, m[x])
+
+    def test_set_operations(self):
+        print("\n[*] Arc consistency revises x == y, Not(x == a) and Or(x == a, ...) with operations of engine instead of enumeration")
+        from vega import ArcConsistency
+        values = [Value('d{}'.format(i)) for i in range(200)]
+        D = Sort('D', values)
+        v = [Variable('a{}'.format(i), D) for i in range(4)]
+        for engine in (Domain.SetDomain, Domain.BitsetDomain):
+            s = Solver(D, Feature(engine=engine, arc_consistency=True))
+            s.add(Eq(v[0], v[1]), Not(Eq(v[0], values[0])), Or(Eq(v[1], values[0]), Eq(v[1], values[1])), Eq(v[2], values[2]), Eq(v[3], v[2]))
+            with unittest.mock.patch.object(ArcConsistency, 'holds', wraps=ArcConsistency.holds) as holds:
+                m = s.model()
+            self.assertEqual(holds.call_count, 0)
+            self.assertEqual(m[v[0]], set([values[1]]))
+            self.assertEqual(m[v[3]], set([values[2]]))
+
+
+class TestCompiler(unittest.TestCase):
+    def test_compile(self):
+        print("\n[*] Constraints are compiled to flat list of instructions")
+        from vega import Compiler
+        expr = And(Eq(x, Int), Not(Eq(y, Pointer)), Eq(x, z), Or(Eq(y, Int), Eq(y, PointerOffset)), Implies(Eq(x, Int), Eq(z, Int)))
+        code = Compiler.compile_expr(expr)
+        print(code)
+        self.assertEqual(code[:8], [Compiler.VISIT, expr, Compiler.AND_EQ, x, Int, Compiler.NOT_EQ, y, Pointer])
+        self.assertEqual(code[8:11], [Compiler.UNIFY, x, z])
+        self.assertEqual(code[11:17], [Compiler.OR_BLOCK, 1, y, 2, Int, PointerOffset])
+        self.assertEqual(code[17:], [Compiler.DEFER, expr.v[-1]])
+        self.assertIs(Compiler.compile_expr(expr), code) # Compiled once
+
+    def test_fallback(self):
+        print("\n[*] Not compiled expressions are evaluated recursively")
+        from vega import Compiler
+        expr = Not(And(Eq(x, Int), Eq(y, Int))) # Or(Not(...), Not(...))
+        self.assertEqual(Compiler.compile_expr(expr)[2], Compiler.EVAL)
+        s = Solver(Any)
+        s.add(Not(Not(Eq(x, Pointer))), expr)
+        self.assertEqual(s.check(), unsat) # Same as recursive evaluation (Or() of Not() is not supported)
+        self.assertEqual(s.variables[x], set([Pointer]))
+
+
+class TestBatch(unittest.TestCase):
+    def test_apply_units(self):
+        print("\n[*] Unit constraints are applied at once (with and without NumPy)")
+        from vega import Batch
+        domains = [set([Int, Pointer, PointerOffset]), set([Int, Pointer])]
+        for numpy in set([Batch.numpy, None]):
+            with unittest.mock.patch.object(Batch, 'numpy', numpy):
+                self.assertEqual(Batch.apply_units(domains, [0, 0, 1], [Int, Pointer, Int], [False, False, True]), {0: set([PointerOffset]), 1: set([Int])})
+                self.assertEqual(Batch.apply_units(domains, [1], [Int], [False]), {1: set([Pointer])})
+                self.assertIsNone(Batch.apply_units(domains, [1, 1], [Int, Pointer], [True, True]))
+                self.assertIsNone(Batch.apply_units(domains, [1], [PointerOffset], [True]))
+                self.assertIsNone(Batch.apply_units(domains, [1, 1], [Int, Pointer], [False, False]))
+
+    def test_solver(self):
+        print("\n[*] Solver applies consecutive unit constraints at once")
+        from vega import Batch
+        v = [Variable('u{}'.format(i), Any) for i in range(Batch.MIN_BATCH_SIZE)]
+        s = Solver(Any)
+        s.add(*[Not(Eq(x, Int)) for x in v])
+        s.add(Eq(v[0], Pointer), Eq(v[0], v[1]))
+        m = s.model()
+        self.assertEqual(m.sat, sat)
+        self.assertEqual(m[v[1]], set([Pointer]))
+        self.assertEqual(m[v[2]], set([Pointer, PointerOffset]))
+
+    def test_unsat(self):
+        print("\n[*] Unit constraints are evaluated one by one if batch is unsat")
+        from vega import Batch
+        v = [Variable('u{}'.format(i), Any) for i in range(Batch.MIN_BATCH_SIZE)]
+        s = Solver(Any)
+        s.add(*[Eq(x, Int) for x in v])
+        s.add(Eq(v[1], Pointer), Eq(v[2], Pointer))
+        self.assertEqual(s.check(), unsat)
+        self.assertEqual(s.variables[v[2]], set([Int])) # Stopped at first unsat constraint
+
+    def test_hold_units(self):
+        print("\n[*] Units asserted one by one in SMT-LIB script are applied in batch")
+        import io
+        import contextlib
+        from vega import Batch
+        from vega.smtlib.app import evaluate_smt2_file
+        n = Batch.MIN_BATCH_SIZE * 2 + 1
+        script = "(declare-datatypes () ((Any (a) (b) (c))))\n"
+        script += "".join("(declare-fun u{} () Any)\n".format(i) for i in range(n))
+        script += "".join("(assert (not (= u{} a)))\n".format(i) for i in range(n))
+        script += "(assert (or (= u0 a) (= u0 b)))\n(check-sat)\n(get-model)\n"
+        out = io.StringIO()
+        with unittest.mock.patch.object(Batch, 'apply_units', wraps=Batch.apply_units) as apply_units:
+            with contextlib.redirect_stdout(out):
+                evaluate_smt2_file(io.StringIO(script), False)
+        self.assertEqual(apply_units.call_count, 2)
+        self.assertTrue(out.getvalue().startswith("sat\n(model\n"))
+        self.assertEqual(out.getvalue().count("(as (or b c) Any)") + out.getvalue().count("(as (or c b) Any)"), n - 1) # Held units are evaluated by check-sat
+        self.assertEqual(out.getvalue().count("(as b Any)"), 1)
+
+    def test_propagate_hold_units(self):
+        print("\n[*] propagate(hold_units=True) leaves trailing units to check()")
+        from vega import Batch
+        v = [Variable('u{}'.format(i), Any) for i in range(Batch.MIN_BATCH_SIZE - 1)]
+        s = Solver(Any)
+        s.add(*[Not(Eq(x, Int)) for x in v])
+        self.assertEqual(s.propagate(hold_units=True), sat)
+        self.assertEqual(s.model_start, 0)
+        s.add(Eq(v[0], Int))
+        self.assertEqual(s.propagate(hold_units=True), unsat) # Not unit
+        s = Solver(Any)
+        s.add(*[Not(Eq(x, Int)) for x in v])
+        self.assertEqual(s.propagate(hold_units=True), sat)
+        self.assertEqual(s.model()[v[-1]], set([Pointer, PointerOffset]))
+        s = Solver(Any)
+        s.add(*[Not(Eq(x, Int)) for x in v[:-2]])
+        self.assertEqual(s.propagate(hold_units=True), sat)
+        s.push()
+        s.add(Not(Eq(v[0], Pointer)), Not(Eq(v[1], Pointer)))
+        self.assertEqual(s.propagate(hold_units=True), sat)
+        s.pop()
+        s.add(Or(Eq(v[0], Int), Eq(v[0], Pointer))) # Not unit (units held before push() are evaluated)
+        self.assertEqual(s.propagate(hold_units=True), sat)
+        self.assertEqual(s.variables[v[0]], set([Pointer]))
+        self.assertEqual(s.model_start, len(s.constraints))
+
+
+class TestSimplify(unittest.TestCase):
+    def test_flatten(self):
+        print("\n[*] Nested And() and Or() are flattened, and duplicated subterms, Top() and Bot() are removed")
+        from vega.Law import simplify
+        self.assertIs(simplify(And(And(Eq(x, Int), Top()), Eq(y, Int), Eq(x, Int))), And(Eq(x, Int), Eq(y, Int)))
+        self.assertIs(simplify(Or(Bot(), Or(Eq(x, Int), Eq(x, Pointer)))), Or(Eq(x, Int), Eq(x, Pointer)))
+        self.assertIs(simplify(Or(Eq(x, Int), Eq(x, Int))), Eq(x, Int))
+        self.assertIsInstance(simplify(And(Eq(x, Int), Bot())), Bot)
+        self.assertIsInstance(simplify(Or(Eq(x, Int), Top())), Top)
+
+    def test_negation_normal_form(self):
+        print("\n[*] Not() is pushed to atoms")
+        from vega.Law import simplify
+        self.assertIs(simplify(Not(Not(Eq(x, Int)))), Eq(x, Int))
+        self.assertIs(simplify(Not(And(Eq(x, Int), Or(Eq(y, Int), Eq(z, Int))))), Or(Not(Eq(x, Int)), And(Not(Eq(y, Int)), Not(Eq(z, Int)))))
+        self.assertIs(simplify(Not(Implies(Eq(x, Int), Eq(y, Int)))), And(Eq(x, Int), Not(Eq(y, Int))))
+        self.assertIsInstance(simplify(Not(Top())), Bot)
+
+    def test_memoized(self):
+        print("\n[*] Simplified expressions are memoized")
+        from vega.Law import simplify
+        expr = And(Eq(x, Int), And(Eq(y, Int)))
+        self.assertIs(simplify(expr), simplify(expr))
+        self.assertIs(expr._simplified, simplify(expr))
+
+    def test_solver(self):
+        print("\n[*] Solver simplifies constraints when they are added")
+        expr = Not(Not(And(Eq(x, Int), Top())))
+        s = Solver(Any)
+        s.add(expr)
+        self.assertEqual(s.constraints, [Eq(x, Int)])
+        self.assertEqual(s.model()[x], set([Int]))
+        s = Solver(Any, Feature(simplify=False))
+        s.add(expr)
+        self.assertEqual(s.constraints, [expr])
+
+    def test_verdict(self):
+        print("\n[*] Simplification does not change verdict (And() having only If() is kept)")
+        from vega.Law import simplify
+        A, B, C, D = [Value(n) for n in 'ABCD']
+        Dom = Sort('Dom', [A, B, C, D])
+        v0, v2, v3, v4, v5 = [Variable('v{}'.format(i), Dom) for i in (0, 2, 3, 4, 5)]
+        deferred = And(If(Not(Eq(v3, C)), Eq(v3, v2), Eq(v2, B)))
+        self.assertIs(simplify(deferred), deferred)
+        constraints = [Implies(Eq(v2, C), And(Not(Eq(v4, B)), Eq(v5, D))), Or(Eq(v3, C), Eq(v3, A)), deferred, Not(Eq(v0, B))]
+        verdicts = []
+        for feature in (Feature(), Feature(simplify=False)):
+            s = Solver(Dom, feature)
+            s.add(*constraints)
+            verdicts.append(s.check())
+        self.assertEqual(verdicts, [unsat, unsat])
+
+
+class TestDeduplicate(unittest.TestCase):
+    def test_duplicate(self):
+        print("\n[*] Duplicated constraints are not stored")
+        s = Solver(Any)
+        s.add(Eq(x, Int), Implies(Eq(y, Int), Eq(z, Int)))
+        s.add(Eq(x, Int), Implies(Eq(y, Int), Eq(z, Int)))
+        self.assertEqual(s.constraints, [Eq(x, Int), Implies(Eq(y, Int), Eq(z, Int))])
+
+    def test_subsumption(self):
+        print("\n[*] Constraints subsumed by units are not stored")
+        s = Solver(Any)
+        s.add(And(Eq(x, Int), Eq(y, Pointer)))
+        s.add(Or(Eq(x, Int), Eq(x, Pointer)), Not(Eq(x, Pointer)), And(Not(Eq(y, Int)), Eq(x, Int)))
+        self.assertEqual(len(s.constraints), 1)
+        s.add(Or(Eq(x, Int), Eq(z, Pointer))) # Constrains z
+        s.add(Not(Eq(z, Int)))
+        self.assertEqual(len(s.constraints), 3)
+        m = s.model()
+        self.assertEqual(m[z], set([Pointer]))
+
+    def test_push_pop(self):
+        print("\n[*] Constraints removed by pop() are stored again")
+        s = Solver(Any)
+        s.push()
+        s.add(Eq(x, Int))
+        s.pop()
+        s.add(Eq(x, Pointer), Not(Eq(x, Int)))
+        self.assertEqual(s.constraints, [Eq(x, Pointer)])
+        self.assertEqual(s.model()[x], set([Pointer]))
+
+    def test_feature(self):
+        print("\n[*] Feature(deduplicate=False) stores all constraints")
+        s = Solver(Any, Feature(deduplicate=False))
+        s.add(Eq(x, Int), Eq(x, Int))
+        self.assertEqual(len(s.constraints), 2)
+
+
+class TestModel(unittest.TestCase):
+    def test_view(self):
+        print("\n[*] Model is view of solver state, and freeze() detaches it")
+        s = Solver(Any)
+        s.add(Not(Eq(x, Int)))
+        m = s.model()
+        frozen = m.freeze()
+        self.assertIs(m.variables, s.variables)
+        s.add(Not(Eq(x, Pointer)))
+        s.check()
+        self.assertEqual(m[x], set([PointerOffset]))
+        self.assertEqual(frozen[x], set([Pointer, PointerOffset]))
+        self.assertIs(frozen.freeze(), frozen)
+
+    def test_items(self):
+        print("\n[*] Model.items() yields values of variables with Ref() followed")
+        s = Solver(Any)
+        s.add(Eq(x, y), Or(Eq(y, Int), Eq(y, Pointer)))
+        m = s.model()
+        self.assertEqual(dict(m.items()), {x: set([Int, Pointer]), y: set([Int, Pointer])})
+        self.assertEqual(set(m), set([x, y]))
+
+    def test_setitem(self):
+        print("\n[*] Model is detached from solver when it is modified")
+        s = Solver(Any)
+        s.add(Not(Eq(x, Int)))
+        m = s.model()
+        m[x] = set([Pointer])
+        self.assertEqual(m[x], set([Pointer]))
+        self.assertEqual(s.model()[x], set([Pointer, PointerOffset]))
+
+    def test_to_smt2(self):
+        print("\n[*] Model is written as response of get-model, optionally filtered by names of variables")
+        s = Solver(Any)
+        s.add(Eq(x, y), Eq(y, Int), Not(Eq(z, Int)))
+        m = s.model()
+        lines = m.to_smt2().splitlines()
+        print(lines)
+        self.assertEqual(lines[0], "(model")
+        self.assertIn("  (define-fun x () Any", lines)
+        self.assertEqual(lines[-1], ")")
+        self.assertEqual(m.to_smt2(prefix='y'), "(model\n  (define-fun y () Any\n    (as Int Any))\n)\n")
+        self.assertEqual(m.to_smt2(pattern='[xz]').count("define-fun"), 2)
+
+    def test_buffered_writer(self):
+        print("\n[*] BufferedWriter writes lines in chunks")
+        import io
+        from vega.Writer import BufferedWriter
+        file = io.StringIO()
+        with unittest.mock.patch.object(file, 'write', wraps=file.write) as write:
+            out = BufferedWriter(file, buffer_size=10)
+            for i in range(5):
+                out.write("line") # Flushed every 2 lines
+            self.assertEqual(write.call_count, 2)
+            out.finalize()
+            self.assertEqual(write.call_count, 3)
+        self.assertEqual(file.getvalue(), "line\n" * 5)
+
 
 class TestUnsat(unittest.TestCase):
     def test_P_and_not_P(self):
@@ -528,6 +1287,65 @@ class TestPloblemOfReorderingConstraints(unittest.TestCase):
         self.assertEqual(m[y], y.sort.values - set([Int, Pointer]))
         self.assertEqual(m[z], z.sort.values - set([Int]))
 
+    def test_reorder_PQQR_fixpoint(self):
+        print("\n[*] Test re-order constraints with tactic Fixpoint: P(y, x), Q(z), Q'(y), R(z, y)")
+        s = Solver(Any, Feature(tactic=Tactic.Fixpoint()))
+        s.add(Implies(
+            Not(Eq(y, Pointer)),
+            Not(Eq(x, Int)),
+        )) # P(y, x)
+        s.add(Not(Eq(z, Int))) # Q(z)
+        s.add(Not(Eq(y, Int))) # Q'(y)
+        s.add(Implies(
+            Not(Eq(z, Int)),
+            Not(Eq(y, Pointer)),
+        )) # R(z, y)
+        m = s.model() # P is evaluated again after R narrows y
+        print(m)
+        self.assertEqual(m.sat, sat)
+        self.assertEqual(m[x], x.sort.values - set([Int]))
+        self.assertEqual(m[y], y.sort.values - set([Int, Pointer]))
+        self.assertEqual(m[z], z.sort.values - set([Int]))
+
+    def test_fixpoint_chain(self):
+        print("\n[*] Tactic Fixpoint propagates chain of Implies in reversed order to its tail")
+        v = [Variable('c{}'.format(i), Any) for i in range(10)]
+        for tactic, expected in [(Tactic.Simple(), Any.values), (Tactic.Fixpoint(), Any.values - set([Int]))]:
+            s = Solver(Any, Feature(tactic=tactic))
+            s.add(Not(Eq(v[0], Int)))
+            for i in reversed(range(len(v) - 1)):
+                s.add(Implies(Not(Eq(v[i], Int)), Not(Eq(v[i + 1], Int))))
+            m = s.model()
+            self.assertEqual(m.sat, sat)
+            self.assertEqual(m[v[-1]], expected)
+
+    def test_reorder_chain(self):
+        print("\n[*] Chain of Implies in reversed order is solved from its head")
+        v = [Variable('c{}'.format(i), Any) for i in range(100)]
+        s = Solver(Any)
+        s.add(Eq(v[0], Pointer))
+        for i in reversed(range(len(v) - 1)):
+            s.add(Implies(Not(Eq(v[i], Int)), Not(Eq(v[i + 1], Int))))
+        m = s.model()
+        self.assertEqual(m.sat, sat)
+        self.assertEqual(m[v[-1]], Any.values - set([Int]))
+
+    def test_scheduler(self):
+        print("\n[*] Scheduler picks woken post-constraints in cyclic order, and forces next one if nothing is ready")
+        from vega.Scheduler import Scheduler
+        scheduler = Scheduler(4)
+        scheduler.wait(0, x)
+        scheduler.wait(1, y)
+        scheduler.ready(2)
+        scheduler.wait(3, x)
+        self.assertEqual(scheduler.next(), (2, False))
+        self.assertEqual(scheduler.next(), (3, True))
+        for i in scheduler.wake(x): # 0 (3 is already picked)
+            scheduler.ready(i)
+        self.assertEqual(scheduler.next(), (0, False))
+        self.assertEqual(scheduler.next(), (1, True))
+        self.assertFalse(scheduler)
+
     ### TODO
     # def test_potential_unsat(self):
     #     print("\n[*] Test potential unsat: Implies(P(x), Q(y)), Implies(R(y), Not(P(x)) where R(y) = true")
@@ -550,5 +1368,201 @@ class TestPloblemOfReorderingConstraints(unittest.TestCase):
     #     self.assertEqual(m[x], x.sort.values - set([Int]))
     #     self.assertEqual(m[y], set([Int, Pointer]))
 
+class TestSmtlibParser(unittest.TestCase):
+    script = """(set-info :status unknown)
+(declare-datatypes () ((Any (a) (b) (c))))
+; (declare-fun a () Any)
+(declare-fun x () Any)
+(assert ; comment in command (
+ (or (= x a)\r
+     (= x c)))
+(check-sat)
+"""
+
+    def test_split_script_to_lines(self):
+        print("\n[*] split_script_to_lines() yields same commands for any chunk size")
+        import io
+        from vega.smtlib.vega.helper import split_script_to_lines
+        expected = [
+            "(set-info :status unknown)",
+            "(declare-datatypes () ((Any (a) (b) (c))))",
+            "(declare-fun x () Any)",
+            "(assert   (or (= x a)      (= x c)))",
+            "(check-sat)",
+        ]
+        for chunk_size in [1, 2, 5, 4096]:
+            self.assertEqual(list(split_script_to_lines(io.StringIO(self.script), chunk_size)), expected)
+
+
+    def test_parse_command(self):
+        print("\n[*] VegaSmtLibParser.parse_command()")
+        from vega.smtlib.vega.VegaSmtLibParser import VegaSmtLibParser
+        parser = VegaSmtLibParser()
+        parser.parse_command("(declare-datatypes () ((Any (a) (b) (c))))")
+        parser.parse_command("(declare-fun x () Any)")
+        cmd = parser.parse_command("(assert (and (or (= x a) (distinct x b)) (=> false (= x c))))")
+        self.assertEqual(cmd.name, 'assert')
+        self.assertEqual(len(cmd.args), 1)
+        fnode = cmd.args[0]
+        self.assertTrue(fnode.is_and())
+        self.assertTrue(fnode.args()[0].is_or())
+        self.assertTrue(fnode.args()[0].args()[1].is_not())
+        self.assertTrue(fnode.args()[0].args()[1].args()[0].is_equals())
+        self.assertTrue(fnode.args()[1].is_implies())
+        self.assertEqual(fnode.args()[1].args()[0].constant_value(), False)
+        self.assertEqual(parser.parse_command("(check-sat)").name, 'check-sat')
+
+    def test_direct_ast_parser(self):
+        print("\n[*] VegaAstSmtLibParser builds same AST as Fnode based parser")
+        import io
+        from vega.smtlib.parse import parse_and_get_script_from_file_stream, parse_cmd
+        script = self.script + "(assert (=> (and (distinct x b) true) (ite (= x a) (= x c) false)))\n"
+        results = []
+        for direct in [False, True]:
+            sorts = {}
+            expr = []
+            for cmd in parse_and_get_script_from_file_stream(io.StringIO(script), direct):
+                res = parse_cmd(cmd, sorts)
+                if res:
+                    expr += res
+            results.append(expr)
+        self.assertEqual(len(results[1]), 2)
+        for a, b in zip(*results):
+            self.assertIs(a, b)
+
+    def test_evaluate_smt2_file(self):
+        print("\n[*] Streaming evaluation of SMT-LIB script")
+        import io
+        import contextlib
+        from vega.smtlib.app import evaluate_smt2_file
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            evaluate_smt2_file(io.StringIO(self.script + "(assert (not (= x a)))\n(check-sat)\n(get-model)\n"), False)
+        self.assertEqual(out.getvalue(), "sat\nsat\n(model\n  (define-fun x () Any\n    (as c Any))\n)\n")
+
+class TestSerialize(unittest.TestCase):
+    def test_to_smt2(self):
+        print("\n[*] Expressions are serialized without recursion (same as AST.to_smt2())")
+        from vega.smtlib.serialize import to_smt2
+        shared = Or(Eq(x, Int), Eq(x, y))
+        exprs = [
+            And(Not(Eq(x, Int)), shared, Top()),
+            If(shared, Implies(Eq(y, Pointer), shared), Bot()),
+            Eq(x, y),
+        ]
+        cache = {}
+        for expr in exprs:
+            self.assertEqual(to_smt2(expr, cache), expr.to_smt2())
+        self.assertEqual(cache[id(shared)], "(or (= x Int) (= x y))")
+
+    def test_evict(self):
+        print("\n[*] Rendered subterms are evicted when all of their parents are rendered")
+        from vega.smtlib.serialize import to_smt2, count_references
+        shared = Or(Eq(x, Int), Not(Eq(x, y))) # Not(x == y) is small (not counted)
+        exprs = [
+            And(Not(Not(Eq(x, Int))), Implies(shared, Or(Eq(y, Int), Eq(y, Pointer)))),
+            If(shared, Not(shared), Bot()),
+            Eq(x, y),
+            Not(shared),
+            Not(shared),
+        ]
+        cache = {}
+        counts = count_references(exprs)
+        self.assertEqual(counts[id(shared)], 3) # Children of Not(shared) are counted once
+        self.assertEqual(counts[id(Not(shared))], 3)
+        self.assertNotIn(id(Not(Eq(x, y))), counts)
+        texts = []
+        for expr in exprs:
+            texts.append(to_smt2(expr, cache, counts))
+            if expr is exprs[0]:
+                self.assertEqual(list(cache), [id(shared)]) # Unshared subterms are evicted
+        self.assertEqual(texts, [expr.to_smt2() for expr in exprs])
+        self.assertEqual(cache, {})
+        self.assertEqual(counts, {})
+
+    def test_deep(self):
+        print("\n[*] Deeply nested expression is serialized")
+        from vega.smtlib.serialize import to_smt2
+        expr = Eq(x, Int)
+        for _ in range(5000):
+            expr = Not(expr)
+        self.assertEqual(to_smt2(expr), "(not " * 5000 + "(= x Int)" + ")" * 5000)
+
+    def test_solver(self):
+        print("\n[*] Solver.to_smt2() writes values excluded by sort of variables")
+        import io
+        s = Solver(Any)
+        s.add(Eq(x, w))
+        file = io.StringIO()
+        s.to_smt2(file)
+        self.assertEqual(file.getvalue(), s.to_smt2())
+        self.assertIn("(assert\n (= x w))\n", s.to_smt2())
+        self.assertIn("(assert\n (not (= w Pointer)))\n", s.to_smt2())
+        self.assertIn("(assert\n (not (= w PointerOffset)))\n", s.to_smt2())
+
+
+class TestBinaryFormat(unittest.TestCase):
+    def test_script(self):
+        print("\n[*] Compiled script is evaluated as same as SMT-LIB script")
+        import io
+        import contextlib
+        from vega.smtlib.app import evaluate_smt2_file, evaluate_binary_file, compile_smt2_file
+        script = TestSmtlibParser.script + """(push 1)
+(assert (and (not (= x c)) (or (= x a) false)))
+(check-sat)
+(get-model)
+(pop 1)
+(assert (=> (distinct x a) (= x c)))
+(get-model)
+"""
+        vgb = io.BytesIO()
+        compile_smt2_file(io.StringIO(script), vgb)
+        outputs = []
+        for evaluate, file in [(evaluate_smt2_file, io.StringIO(script)), (evaluate_binary_file, io.BytesIO(vgb.getvalue()))]:
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                evaluate(file, False)
+            outputs.append(out.getvalue())
+        print(outputs[1])
+        self.assertEqual(outputs[0], outputs[1])
+
+    def test_nodes(self):
+        print("\n[*] AST nodes are restored as identical nodes")
+        import io
+        from vega.BinaryFormat import dump_script, load_script
+        from vega.smtlib.vega.Command import Command
+        exprs = [
+            And(Eq(x, Int), Or(Eq(y, Pointer), Top()), comment="comment"),
+            If(Not(Eq(x, y)), Bot(), Eq(w, Int)),
+            Implies(Eq(x, Int), And(Eq(x, Int), Or(Eq(y, Pointer), Top()), comment="comment")),
+        ]
+        out = io.BytesIO()
+        dump_script([Command('declare-datatypes', [Any])] + [Command('assert', [e]) for e in exprs] + [Command('check-sat', [])], out)
+        script = load_script(io.BytesIO(out.getvalue()))
+        self.assertEqual([cmd.name for cmd in script], ['declare-datatypes', 'assert', 'assert', 'assert', 'check-sat'])
+        self.assertIs(script[0].args[0], Any)
+        for cmd, expr in zip(script[1:], exprs):
+            self.assertIs(cmd.args[0], expr)
+
+    def test_model(self):
+        print("\n[*] Dump and load Model")
+        import io
+        from vega.BinaryFormat import dump_model, load_model
+        for engine in [Domain.SetDomain, Domain.BitsetDomain]:
+            s = Solver(Any, Feature(engine=engine))
+            s.add(Eq(x, y), Eq(y, z), Or(Eq(z, Int), Eq(z, Pointer)), Not(Eq(w, Pointer)))
+            m = s.model()
+            out = io.BytesIO()
+            dump_model(m, out)
+            n = load_model(io.BytesIO(out.getvalue()))
+            print(n)
+            self.assertEqual(n.sat, sat)
+            self.assertIsInstance(n.engine, engine)
+            for v in [x, y, z, w]:
+                self.assertEqual(n[v], m[v])
+            self.assertEqual(n.ref.getRef(x), n.ref.getRef(z))
+
+        self.assertRaises(Exception, load_model, io.BytesIO(b'VGB\x01'))
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -1,4 +1,5 @@
 from functools import reduce
+from weakref import WeakValueDictionary
 
 def checkAllItemsAreAST(*z):
     return reduce(lambda r, x: r and (isinstance(x, AST)), z, True)
@@ -11,7 +12,46 @@ def fmt_comment(comment):
         return " ; {}".format(comment)
     return ""
 
-class AST:
+### Hash-consing of AST nodes.
+### Constructing a node returns canonical shared instance if identical node already exists,
+### so that nodes are compared by identity and never holds duplicate subtrees.
+class Interned(type):
+    def __init__(cls, name, bases, namespace):
+        type.__init__(cls, name, bases, namespace)
+        cls._interned = WeakValueDictionary() # key -> node (a table per class)
+
+    def __call__(cls, *args, **kwargs):
+        key = cls._key(*args, **kwargs)
+        node = cls._interned.get(key)
+        if node is None:
+            node = type.__call__(cls, *args, **kwargs)
+            cls._interned[key] = node
+        return node
+
+### Used by pickle and copy module to restore interned nodes
+def _intern(cls, args, kwargs):
+    return cls(*args, **kwargs)
+
+NO_VARIABLES = frozenset()
+
+### Union of frozensets. Reuses one of given sets if possible to share sets among nodes
+def unionVariables(sets):
+    res = NO_VARIABLES
+    for x in sets:
+        if not res:
+            res = x
+        elif x and not x <= res:
+            res = res | x
+    return res
+
+### NOTE: Nodes are immutable. Equality of nodes is identity (object.__eq__).
+class AST(metaclass=Interned):
+    __slots__ = ('_hash', '_variables', '_condition_variables', '_parent_condition_variables', '_code', '_simplified', '__weakref__')
+    _key = staticmethod(lambda: ())
+
+    def __init__(self):
+        self._hash = hash(self.__class__.__name__)
+
     def __repr__(self):
         return "{}()".format(self.__class__.__name__)
 
@@ -19,20 +59,57 @@ class AST:
         return self.__repr__()
 
     def __hash__(self):
-        return hash(self.__repr__())
+        return self._hash
+
+    def __reduce__(self):
+        return (_intern, (self.__class__, self._args(), self._kwargs()))
 
+    def _args(self):
+        return ()
+
+    def _kwargs(self):
+        return {}
+
+    ### @return frozenset of Variable (computed once)
     def getVariables(self):
-        return set()
+        try:
+            return self._variables
+        except AttributeError:
+            self._variables = self._collectVariables()
+            return self._variables
 
+    ### @return frozenset of Variable used in condition clause (computed once)
     def getConditionVariables(self, is_parent_condition=False):
-        return set()
-
+        try:
+            if is_parent_condition:
+                return self._parent_condition_variables
+            else:
+                return self._condition_variables
+        except AttributeError:
+            res = self._collectConditionVariables(is_parent_condition)
+            if is_parent_condition:
+                self._parent_condition_variables = res
+            else:
+                self._condition_variables = res
+            return res
+
+    def _collectVariables(self):
+        return NO_VARIABLES
+
+    def _collectConditionVariables(self, is_parent_condition):
+        return NO_VARIABLES
+
+### NOTE: Variables are identical if their name and sort are identical
 class Variable(AST):
+    __slots__ = ('name', 'sort')
+    _key = staticmethod(lambda name, sort: (name, id(sort))) # Interned sort is alive while the variable is alive
+
     def __init__(self, name, sort):
         assert isinstance(name, str)
         assert isinstance(sort, Sort)
         self.name = name
         self.sort = sort
+        self._hash = hash(name)
 
     def __repr__(self):
         return self.name
@@ -41,48 +118,58 @@ class Variable(AST):
     def describe(self):
         return "{}(name={}, sort={})".format(self.__class__.__name__, self.name, self.sort)
 
-    def __hash__(self):
-        return hash(self.__repr__())
+    def _args(self):
+        return (self.name, self.sort)
 
-    def __eq__(a, b):
-        return a.name == b.name # and a.sort == b.sort
+    def _collectVariables(self):
+        return frozenset([self])
 
-    def getVariables(self):
-        return set([self])
-
-    def getConditionVariables(self, is_parent_condition=False):
+    def _collectConditionVariables(self, is_parent_condition):
         if is_parent_condition:
             return self.getVariables()
         else:
-            return set()
+            return NO_VARIABLES
 
     def to_smt2(self):
         return self.name
-    
+
+### NOTE: Sorts are identical if their name and values are equal, but `==` also holds on sorts which have same name or same values
+### NOTE: Do not modify `values` after construction
 class Sort(AST):
+    __slots__ = ('name', 'values')
+    _key = staticmethod(lambda name, values: (name, frozenset(values)))
+
     def __init__(self, name, values):
         assert isinstance(name, str)
         assert isinstance(values, set) or isinstance(values, list)
         assert checkAllItemsAreValue(*values)
         self.name = name
         self.values = set(values)
+        self._hash = hash(self.__repr__())
 
     def __repr__(self):
         return "{}({})".format(self.__class__.__name__, self.name)
 
     def __hash__(self):
-        return hash(self.__repr__())
+        return self._hash
 
     def __eq__(a, b):
         return a.name == b.name or a.values == b.values
 
+    def _args(self):
+        return (self.name, self.values)
+
     def to_smt2(self):
         return self.name
 
 class Value(AST):
+    __slots__ = ('name',)
+    _key = staticmethod(lambda name: name)
+
     def __init__(self, name):
         assert isinstance(name, str)
         self.name = name
+        self._hash = hash(name)
 
     def __repr__(self):
         return self.name
@@ -90,61 +177,64 @@ class Value(AST):
     def describe(self):
         return "{}({})".format(self.__class__.__name__, self.name)
 
-    def __hash__(self):
-        return hash(self.__repr__())
-
-    def __eq__(a, b):
-        return a.name == b.name
+    def _args(self):
+        return (self.name,)
 
     def to_smt2(self):
         return self.name
 
 ### Used to describe equality x == y |-> x = Ref(y)
 class Ref(AST):
+    __slots__ = ('variable',)
+    _key = staticmethod(lambda var: var)
+
     def __init__(self, var):
         assert isinstance(var, Variable)
         self.variable = var
-    
+        self._hash = hash((self.__class__.__name__, var))
+
     def __repr__(self):
         return "{}({})".format(self.__class__.__name__, self.variable)
 
-    def __eq__(a, b):
-        return  a.__class__.__name__ == b.__class__.__name__ and a.variable == b.variable
+    def _args(self):
+        return (self.variable,)
 
 class Const(AST):
-    def __init__(self):
-        pass
+    __slots__ = ()
 
     def __repr__(self):
         return "{}()".format(self.__class__.__name__)
 
-    def __eq__(a, b):
-        return a.__class__.__name__ == b.__class__.__name__
-
-    def getVariables(self):
-        return set()
-
     def to_smt2(self):
         return self.__class__.__name__
 
 class NOp(AST):
+    __slots__ = ('v', 'comment')
+    _key = staticmethod(lambda *v, comment="": (v, comment))
+
     def __init__(self, *v, comment=""):
         assert len(v) > 0
         assert checkAllItemsAreAST(*v), "v={}".format(v)
-        self.v = list(v)
+        self.v = v
         self.comment = comment
+        self._hash = hash((self.__class__.__name__, v, comment))
 
     def __repr__(self):
         return "{}({}){}".format(self.__class__.__name__, ', '.join(['{}'.format(x) for x in self.v]), fmt_comment(self.comment))
 
-    def __eq__(a, b):
-        return a.v == b.v
+    def _args(self):
+        return self.v
 
-    def getVariables(self):
-        return reduce(lambda r, expr: r | expr.getVariables(), self.v, set())
+    def _kwargs(self):
+        if self.comment:
+            return {'comment': self.comment}
+        return {}
 
-    def getConditionVariables(self, is_parent_condition=False):
-        return reduce(lambda r, expr: r | expr.getConditionVariables(is_parent_condition), self.v, set())
+    def _collectVariables(self):
+        return unionVariables([expr.getVariables() for expr in self.v])
+
+    def _collectConditionVariables(self, is_parent_condition):
+        return unionVariables([expr.getConditionVariables(is_parent_condition) for expr in self.v])
 
     def to_smt2(self):
         if self.v:
@@ -153,77 +243,94 @@ class NOp(AST):
             return "true"
 
 class UniOp(NOp):
+    __slots__ = ('v1',)
+    _key = staticmethod(lambda v1, comment="": (v1, comment))
+
     def __init__(self, v1, comment=""):
         assert isinstance(v1, AST)
         self.v1 = v1
         self.comment = comment
-    
+        self._hash = hash((self.__class__.__name__, v1, comment))
+
     def __repr__(self):
         return "{}({}){}".format(self.__class__.__name__, self.v1, fmt_comment(self.comment))
 
-    def __eq__(a, b):
-        return a.v1 == b.v1
+    def _args(self):
+        return (self.v1,)
 
-    def getVariables(self):
+    def _collectVariables(self):
         return self.v1.getVariables()
 
-    def getConditionVariables(self, is_parent_condition=False):
+    def _collectConditionVariables(self, is_parent_condition):
         return self.v1.getConditionVariables(is_parent_condition)
 
     def to_smt2(self):
         return "({} {})".format(self.__class__.__name__.lower(), self.v1.to_smt2())
 
 class BinOp(NOp):
+    __slots__ = ('v1', 'v2')
+    _key = staticmethod(lambda v1, v2, comment="": (v1, v2, comment))
+
     def __init__(self, v1, v2, comment=""):
         assert isinstance(v1, AST)
         assert isinstance(v2, AST)
         self.v1 = v1
         self.v2 = v2
         self.comment = comment
-    
+        self._hash = hash((self.__class__.__name__, v1, v2, comment))
+
     def __repr__(self):
         return "{}({}, {}){}".format(self.__class__.__name__, self.v1, self.v2, fmt_comment(self.comment))
 
-    def __eq__(a, b):
-        return a.v1 == b.v1 and a.v2 == b.v2
+    def _args(self):
+        return (self.v1, self.v2)
 
-    def getVariables(self):
-        return self.v1.getVariables() | self.v2.getVariables()
+    def _collectVariables(self):
+        return unionVariables([self.v1.getVariables(), self.v2.getVariables()])
 
-    def getConditionVariables(self, is_parent_condition=False):
-        return self.v1.getConditionVariables(is_parent_condition) | self.v2.getConditionVariables(is_parent_condition)
+    def _collectConditionVariables(self, is_parent_condition):
+        return unionVariables([self.v1.getConditionVariables(is_parent_condition), self.v2.getConditionVariables(is_parent_condition)])
 
     def to_smt2(self):
         return "({} {} {})".format(self.__class__.__name__.lower(), self.v1, self.v2)
 
 ### Holds no AST nodes
 class Terminate(Const):
-    pass
+    __slots__ = ()
 
 ### True
 class Top(Const):
+    __slots__ = ()
+
     def to_smt2(self):
         return "true"
 
 ### False
 class Bot(Const):
+    __slots__ = ()
+
     def to_smt2(self):
         return "false"
 
 class Not(UniOp):
-    pass
+    __slots__ = ()
 
 class Eq(BinOp):
+    __slots__ = ()
+
     def to_smt2(self):
         return "(= {} {})".format(self.v1, self.v2)
 
 class And(NOp):
-    pass
+    __slots__ = ()
 
 class Or(NOp):
-    pass
+    __slots__ = ()
 
 class If(AST):
+    __slots__ = ('cond_clause', 'then_clause', 'else_clause')
+    _key = staticmethod(lambda cond_clause, then_clause, else_clause: (cond_clause, then_clause, else_clause))
+
     def __init__(self, cond_clause, then_clause, else_clause):
         assert isinstance(cond_clause, AST)
         assert isinstance(then_clause, AST)
@@ -231,33 +338,44 @@ class If(AST):
         self.cond_clause = cond_clause
         self.then_clause = then_clause
         self.else_clause = else_clause
+        self._hash = hash((self.__class__.__name__, cond_clause, then_clause, else_clause))
 
     def __repr__(self):
         return "{}({}, {}, {})".format(self.__class__.__name__, self.cond_clause, self.then_clause, self.else_clause)
 
-    def getVariables(self):
-        return self.cond_clause.getVariables() | self.then_clause.getVariables() | self.else_clause.getVariables()
+    def _args(self):
+        return (self.cond_clause, self.then_clause, self.else_clause)
 
-    def getConditionVariables(self, is_parent_condition=False):
+    def _collectVariables(self):
+        return unionVariables([self.cond_clause.getVariables(), self.then_clause.getVariables(), self.else_clause.getVariables()])
+
+    def _collectConditionVariables(self, is_parent_condition):
         return self.cond_clause.getConditionVariables(True)
 
     def to_smt2(self):
         return "(ite {} {} {})".format(self.cond_clause.to_smt2(), self.then_clause.to_smt2(), self.else_clause.to_smt2())
 
 class Implies(AST):
+    __slots__ = ('left', 'right')
+    _key = staticmethod(lambda left, right: (left, right))
+
     def __init__(self, left, right):
         assert isinstance(left, AST)
         assert isinstance(right, AST)
         self.left = left
         self.right = right
+        self._hash = hash((self.__class__.__name__, left, right))
 
     def __repr__(self):
         return "{}({}, {})".format(self.__class__.__name__, self.left, self.right)
 
-    def getVariables(self):
-        return self.left.getVariables() | self.right.getVariables()
+    def _args(self):
+        return (self.left, self.right)
 
-    def getConditionVariables(self, is_parent_condition=False):
+    def _collectVariables(self):
+        return unionVariables([self.left.getVariables(), self.right.getVariables()])
+
+    def _collectConditionVariables(self, is_parent_condition):
         return self.left.getConditionVariables(True)
 
     def to_smt2(self):
@@ -0,0 +1,154 @@
+from collections import deque
+from itertools import product
+
+from .AST import *
+
+### Generalized arc consistency (AC-3) on constraints over few variables (see Feature(arc_consistency=True)).
+### Value of variable is removed from its domain if no values of other variables in a constraint satisfy the constraint with it.
+### Constraints are interpreted in classical logic. Constraints having If() or Implies() are not revised,
+### since Solver assumes their condition clauses whenever possible (revision in classical logic would change results).
+### x == a, x == y, Not(x == a) and Or(x == a, x == b, ...) are revised with operations of DomainEngine, and others by enumeration of product of domains.
+
+### Constraints over more variables than this are not revised (revision enumerates product of domains)
+MAX_ARITY = 2
+
+### Other constraints than x == a, x == y, Not(x == a) and Or(x == a, x == b, ...) are revised by enumeration
+### only while product of sizes of their domains is at most this (they are revised again when the domains are narrowed)
+MAX_ENUMERATION = 64
+
+### Kinds of revision (operations on domain objects of engine)
+EQ_VALUE = 0  # x == a: intersection with singleton
+UNIFY = 1     # x == y: intersection of two domains
+NOT_EQ = 2    # Not(x == a): removal
+OR_VALUES = 3 # Or(x == a, x == b, ...): intersection with of()
+ENUMERATE = 4 # Others: enumeration of product of domains with holds()
+
+### @param assignment: variable -> Value
+### @return True if expr holds on assignment, or None if expr is not supported (e.g. If() and Implies())
+def holds(expr, assignment):
+    if isinstance(expr, Eq):
+        if isinstance(expr.v2, Value):
+            return assignment[expr.v1] is expr.v2
+        if isinstance(expr.v2, Variable):
+            return assignment[expr.v1] is assignment[expr.v2]
+        return None
+    if isinstance(expr, Not):
+        res = holds(expr.v1, assignment)
+        return None if res is None else not res
+    if isinstance(expr, And) or isinstance(expr, Or):
+        res = [holds(x, assignment) for x in expr.v]
+        if None in res:
+            return None
+        return all(res) if isinstance(expr, And) else any(res)
+    if isinstance(expr, Top) or isinstance(expr, Terminate):
+        return True
+    if isinstance(expr, Bot):
+        return False
+    return None
+
+### @return (kind, operand) of revision of expr (see EQ_VALUE etc.)
+def _classify(expr, getRef, engine):
+    cls = expr.__class__
+    if cls is Eq:
+        if isinstance(expr.v2, Value):
+            return EQ_VALUE, expr.v2
+        if isinstance(expr.v2, Variable):
+            return UNIFY, None
+    elif cls is Not:
+        v = expr.v1
+        if v.__class__ is Eq and isinstance(v.v2, Value):
+            return NOT_EQ, v.v2
+    elif cls is Or:
+        root = None
+        for e in expr.v:
+            if not (e.__class__ is Eq and isinstance(e.v2, Value)) or (root is not None and not getRef(e.v1) is root):
+                return ENUMERATE, None
+            root = getRef(e.v1)
+        full = engine.full()
+        return OR_VALUES, engine.of([e.v2 for e in expr.v if engine.contains(full, e.v2)])
+    return ENUMERATE, None
+
+### @param engine: DomainEngine of domain objects
+### @param getRef: variable -> root variable
+### @param getDomain: root variable -> domain object
+### @param setDomain: (root variable, domain object) -> None; called when domain is narrowed
+### @return False if domain of some variable gets blank (unsat), otherwise True
+def prune(constraints, engine, getRef, getDomain, setDomain):
+    ### Roots of variables of constraints to be revised
+    roots = []
+    revisions = []
+    watches = {} # root -> indices of constraints
+    for i, expr in enumerate(constraints):
+        rs = sorted(set(map(getRef, expr.getVariables())), key=lambda v: v.name)
+        if 0 < len(rs) <= MAX_ARITY:
+            for root in rs:
+                watches.setdefault(root, []).append(i)
+        else:
+            rs = None
+        roots.append(rs)
+        revisions.append(_classify(expr, getRef, engine) if rs is not None else None)
+
+    queue = deque(i for i, rs in enumerate(roots) if rs is not None)
+    queued = set(queue)
+
+    ### @return False if domain gets blank
+    def narrow(i, root, old, new):
+        if engine.size(new) < engine.size(old):
+            if not new:
+                return False
+            setDomain(root, new)
+            for j in watches[root]:
+                if j != i and not j in queued and roots[j] is not None:
+                    queued.add(j)
+                    queue.append(j)
+        return True
+
+    while queue:
+        i = queue.popleft()
+        queued.discard(i)
+        rs = roots[i]
+        kind, operand = revisions[i]
+        if kind == EQ_VALUE:
+            d = getDomain(rs[0])
+            if not narrow(i, rs[0], d, engine.intersect(d, engine.singleton(operand))):
+                return False
+        elif kind == NOT_EQ:
+            d = getDomain(rs[0])
+            if engine.contains(d, operand) and not narrow(i, rs[0], d, engine.remove(d, operand)):
+                return False
+        elif kind == OR_VALUES:
+            d = getDomain(rs[0])
+            if not narrow(i, rs[0], d, engine.intersect(d, operand)):
+                return False
+        elif kind == UNIFY:
+            if len(rs) == 1: # x == x
+                continue
+            a, b = getDomain(rs[0]), getDomain(rs[1])
+            d = engine.intersect(a, b)
+            if not narrow(i, rs[0], a, d) or not narrow(i, rs[1], b, d):
+                return False
+        else:
+            domains = [getDomain(root) for root in rs]
+            n = 1
+            for d in domains:
+                n *= engine.size(d)
+            if n > MAX_ENUMERATION: # Revised again when domains are narrowed
+                continue
+            expr = constraints[i]
+            supports = [set() for _ in rs]
+            positions = [(v, rs.index(getRef(v))) for v in expr.getVariables()]
+            for values in product(*[engine.values(d) for d in domains]):
+                assignment = dict((v, values[k]) for v, k in positions)
+                res = holds(expr, assignment)
+                if res is None: # Unsupported expression
+                    roots[i] = None
+                    break
+                if res:
+                    for support, value in zip(supports, values):
+                        support.add(value)
+            if roots[i] is None:
+                continue
+            for root, domain, support in zip(rs, domains, supports):
+                if not narrow(i, root, domain, engine.of(support)):
+                    return False
+    return True
@@ -0,0 +1,81 @@
+try:
+    import numpy
+except ImportError: # Optional dependency (pure Python implementation is used)
+    numpy = None
+
+### Batch evaluation of unit constraints (i.e. x == a and Not(x == a)) used by Solver.propagate().
+### Units are applied to domains at once, since results of successful units do not depend on their order.
+
+### Minimum number of consecutive unit constraints to be applied in batch
+MIN_BATCH_SIZE = 32
+
+### Units are given as lists of same length: i-th unit is `x == a` (or `Not(x == a)`) where x has domain domains[rows[i]], a is values[i]
+### @param domains: list of set of Value
+### @param polarities: list of bool (True for x == a, False for Not(x == a))
+### @return dict of row -> set of Value for changed domains, or None if some domain gets blank (unsat)
+def apply_units(domains, rows, values, polarities):
+    if numpy is not None:
+        return _apply_units_numpy(domains, rows, values, polarities)
+    else:
+        return _apply_units(domains, rows, values, polarities)
+
+def _apply_units(domains, rows, values, polarities):
+    res = {}
+    for row, value, polarity in zip(rows, values, polarities):
+        d = res.get(row)
+        if d is None:
+            d = res[row] = set(domains[row])
+        if polarity:
+            if value in d:
+                if len(d) > 1:
+                    d.clear()
+                    d.add(value)
+            else:
+                return None
+        else:
+            d.discard(value)
+            if not d:
+                return None
+    return dict((row, d) for row, d in res.items() if len(d) < len(domains[row]))
+
+### Applies units to variables x values boolean matrix with scatter operations
+def _apply_units_numpy(domains, rows, values, polarities):
+    ### Values are indexed by id() since nodes are interned (hashing AST nodes is slower)
+    columns = {}
+    column_values = []
+    for d in domains:
+        for value in d:
+            if not id(value) in columns:
+                columns[id(value)] = len(column_values)
+                column_values.append(value)
+    cols = []
+    for value in values:
+        col = columns.get(id(value))
+        if col is None:
+            col = columns[id(value)] = len(column_values)
+            column_values.append(value)
+        cols.append(col)
+
+    matrix = numpy.zeros((len(domains), len(column_values)), dtype=bool)
+    matrix[[row for row, d in enumerate(domains) for _ in d], [columns[id(value)] for d in domains for value in d]] = True
+    before = matrix.copy()
+
+    rows = numpy.array(rows, dtype=numpy.intp)
+    cols = numpy.array(cols, dtype=numpy.intp)
+    polarities = numpy.array(polarities, dtype=bool)
+
+    ### Not(x == a)
+    matrix[rows[~polarities], cols[~polarities]] = False
+
+    ### x == a (unsat if row has multiple values)
+    keep = numpy.zeros_like(matrix)
+    keep[rows[polarities], cols[polarities]] = True
+    if (keep.sum(axis=1) > 1).any():
+        return None
+    constrained = keep.any(axis=1)
+    matrix[constrained] &= keep[constrained]
+
+    if not matrix.any(axis=1).all(): # Blank rows
+        return None
+    changed = numpy.flatnonzero((matrix != before).any(axis=1))
+    return dict((row, set(column_values[k] for k in numpy.flatnonzero(matrix[row]))) for row in changed.tolist())
@@ -0,0 +1,390 @@
+import io
+import sys
+from array import array
+
+from .Exceptions import *
+from .AST import *
+from . import Domain
+from .Map import RefMap
+from .Model import Model
+from . import Satisfiability
+from .smtlib.vega.Command import Command
+
+### Binary format of parsed script (.vgb), Model (.vgm) and component of constraints (sent to worker process).
+###
+### File consists of magic, header and sections. Every section except string bytes is array of int32 (little endian).
+###   magic           4 bytes
+###   header          [length of each section]
+###   string lengths  [len(utf-8 bytes) of string #i]
+###   string bytes    utf-8 bytes of all strings
+###   sorts           [name, number of values, value names...] (names are string ids)
+###   nodes           [kind, extra, number of args, args...] in topological order (children first)
+###   body            commands of script or entries of model
+###
+### Node #i is i-th node record. `extra` is string id of name (Variable, Value) or comment (NOp).
+### Args of Variable is [sort id] and args of other nodes are node ids.
+### Whole file is loaded by single bulk read and each section is converted by array.frombytes().
+
+SCRIPT_MAGIC = b'VGB\x01'
+MODEL_MAGIC = b'VGM\x01'
+COMPONENT_MAGIC = b'VGC\x01'
+
+### Kind of node
+VALUE, VARIABLE, TOP, BOT, NOT, EQ, AND, OR, IF, IMPLIES = range(10)
+NODE_KINDS = {
+    Value: VALUE,
+    Variable: VARIABLE,
+    Top: TOP,
+    Bot: BOT,
+    Not: NOT,
+    Eq: EQ,
+    And: AND,
+    Or: OR,
+    If: IF,
+    Implies: IMPLIES,
+}
+NOP_CLASSES = {NOT: Not, EQ: Eq, AND: And, OR: Or}
+
+### Code of command
+DECLARE_SORT, DECLARE_FUN, ASSERT, CHECK_SAT, GET_MODEL, PUSH, POP, SET_INFO = range(8)
+COMMAND_CODES = {
+    'declare-datatypes': DECLARE_SORT,
+    'declare-fun': DECLARE_FUN,
+    'set-info': SET_INFO,
+    'assert': ASSERT,
+    'check-sat': CHECK_SAT,
+    'get-model': GET_MODEL,
+    'push': PUSH,
+    'pop': POP,
+}
+COMMAND_NAMES = {code: name for name, code in COMMAND_CODES.items()}
+
+### Code of satisfiability and model entry
+SAT, UNSAT, UNKNOWN = range(3)
+ENTRY_VALUES, ENTRY_REF = range(2)
+
+NUMBER_OF_SECTIONS = 6
+
+def _int_array(values=()):
+    return array('i', values)
+
+def _to_bytes(a):
+    if sys.byteorder == 'big':
+        a = array(a.typecode, a)
+        a.byteswap()
+    return a.tobytes()
+
+def _from_bytes(b):
+    a = _int_array()
+    a.frombytes(b)
+    if sys.byteorder == 'big':
+        a.byteswap()
+    return a
+
+### Assigns ids to strings, sorts and AST nodes and builds flat tables of them
+class Encoder:
+    def __init__(self):
+        self.string_ids = {'': 0}
+        self.strings = ['']
+        self.sort_ids = {}  # id(Sort) -> int
+        self.sort_list = [] # Keeps sorts alive while their ids are used
+        self.sorts = _int_array()
+        self.node_ids = {}  # AST -> int (AST nodes are interned)
+        self.nodes = _int_array()
+        self.body = _int_array()
+
+    def string(self, s):
+        i = self.string_ids.get(s)
+        if i is None:
+            i = len(self.strings)
+            self.string_ids[s] = i
+            self.strings.append(s)
+        return i
+
+    def sort(self, sort):
+        i = self.sort_ids.get(id(sort))
+        if i is None:
+            i = len(self.sort_list)
+            self.sort_ids[id(sort)] = i
+            self.sort_list.append(sort)
+            values = sorted(sort.values, key=lambda v: v.name)
+            self.sorts.extend([self.string(sort.name), len(values)])
+            self.sorts.extend([self.string(v.name) for v in values])
+        return i
+
+    ### @return id of node. Registers node and its descendants without recursion.
+    def node(self, root):
+        node_ids = self.node_ids
+        if root in node_ids:
+            return node_ids[root]
+        stack = [(root, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if node in node_ids:
+                continue
+            children = _children(node)
+            if expanded or not children:
+                self.__addNode(node, children)
+            else:
+                stack.append((node, True))
+                for child in reversed(children):
+                    if not child in node_ids:
+                        stack.append((child, False))
+        return node_ids[root]
+
+    def __addNode(self, node, children):
+        kind = NODE_KINDS.get(node.__class__)
+        if kind is None:
+            raise UnhandledCaseError("node = {}".format(node))
+        if kind == VARIABLE:
+            record = [kind, self.string(node.name), 1, self.sort(node.sort)]
+        elif kind == VALUE:
+            record = [kind, self.string(node.name), 0]
+        else:
+            comment = getattr(node, 'comment', "")
+            record = [kind, self.string(comment), len(children)] + [self.node_ids[x] for x in children]
+        self.node_ids[node] = len(self.node_ids)
+        self.nodes.extend(record)
+
+    def write(self, file, magic):
+        string_bytes = [s.encode('utf-8') for s in self.strings]
+        sections = [
+            _to_bytes(_int_array([len(b) for b in string_bytes])),
+            b''.join(string_bytes),
+            _to_bytes(self.sorts),
+            _to_bytes(self.nodes),
+            _to_bytes(self.body),
+        ]
+        header = _int_array([len(self.strings)] + [len(x) for x in sections])
+        assert len(header) == NUMBER_OF_SECTIONS
+        file.write(magic)
+        file.write(_to_bytes(header))
+        for x in sections:
+            file.write(x)
+
+def _children(node):
+    if isinstance(node, UniOp):
+        return (node.v1,)
+    if isinstance(node, BinOp):
+        return (node.v1, node.v2)
+    if isinstance(node, NOp):
+        return node.v
+    if isinstance(node, If):
+        return (node.cond_clause, node.then_clause, node.else_clause)
+    if isinstance(node, Implies):
+        return (node.left, node.right)
+    return ()
+
+### Restores strings, sorts and AST nodes from tables built by Encoder
+class Decoder:
+    def __init__(self, data, magic):
+        data = memoryview(data)
+        if bytes(data[:len(magic)]) != magic:
+            raise ExecutionError("Not a vega binary file (expected magic {})".format(magic))
+        pos = len(magic)
+        header_size = NUMBER_OF_SECTIONS * 4
+        header = _from_bytes(data[pos:pos + header_size])
+        pos += header_size
+        number_of_strings, sections = header[0], []
+        for size in header[1:]:
+            sections.append(data[pos:pos + size])
+            pos += size
+        string_lengths, string_bytes, sorts, nodes, body = sections
+        if len(string_lengths) != number_of_strings * 4 or pos != len(data):
+            raise ExecutionError("Broken vega binary file")
+
+        self.strings = []
+        offset = 0
+        string_bytes = bytes(string_bytes)
+        for length in _from_bytes(string_lengths):
+            self.strings.append(string_bytes[offset:offset + length].decode('utf-8'))
+            offset += length
+        self.sorts = self.__decodeSorts(_from_bytes(sorts))
+        self.nodes = self.__decodeNodes(_from_bytes(nodes))
+        self.body = _from_bytes(body)
+
+    def __decodeSorts(self, table):
+        strings = self.strings
+        res = []
+        i = 0
+        while i < len(table):
+            name, n = table[i], table[i + 1]
+            res.append(Sort(strings[name], [Value(strings[x]) for x in table[i + 2:i + 2 + n]]))
+            i += 2 + n
+        return res
+
+    def __decodeNodes(self, table):
+        strings, sorts = self.strings, self.sorts
+        res = []
+        append = res.append
+        i = 0
+        while i < len(table):
+            kind, extra, n = table[i], table[i + 1], table[i + 2]
+            args = table[i + 3:i + 3 + n]
+            i += 3 + n
+            if kind == VARIABLE:
+                append(Variable(strings[extra], sorts[args[0]]))
+            elif kind == VALUE:
+                append(Value(strings[extra]))
+            elif kind == TOP:
+                append(Top())
+            elif kind == BOT:
+                append(Bot())
+            elif kind in NOP_CLASSES:
+                cls = NOP_CLASSES[kind]
+                children = [res[x] for x in args]
+                if strings[extra]:
+                    append(cls(*children, comment=strings[extra]))
+                else:
+                    append(cls(*children))
+            elif kind == IF:
+                append(If(res[args[0]], res[args[1]], res[args[2]]))
+            elif kind == IMPLIES:
+                append(Implies(res[args[0]], res[args[1]]))
+            else:
+                raise ExecutionError("Unknown node kind: {}".format(kind))
+        return res
+
+### Writes script (iterable of Command built by VegaAstSmtLibParser) to binary file opened with 'wb'.
+### Arguments of commands not affecting result (i.e. declare-fun, set-info) are dropped.
+def dump_script(script, file):
+    encoder = Encoder()
+    body = encoder.body
+    for cmd in script:
+        code = COMMAND_CODES.get(cmd.name)
+        if code == DECLARE_SORT:
+            datatype = cmd.args[0]
+            if not isinstance(datatype, Sort):
+                raise UnhandledCaseError("datatype = {}".format(datatype))
+            body.extend([code, encoder.sort(datatype)])
+        elif code == ASSERT:
+            for expr in cmd.args:
+                body.extend([code, encoder.node(expr)])
+        elif code in [PUSH, POP]:
+            body.extend([code, cmd.args[0]])
+        elif code is not None:
+            body.extend([code, 0])
+        else:
+            raise UnhandledCaseError("cmd = {}".format(cmd))
+    encoder.write(file, SCRIPT_MAGIC)
+
+### @return list of Command, which can be passed to vega.smtlib.app.evaluate_script()
+def load_script(file):
+    decoder = Decoder(file.read(), SCRIPT_MAGIC)
+    body = decoder.body
+    res = []
+    for i in range(0, len(body), 2):
+        code, arg = body[i], body[i + 1]
+        if code == DECLARE_SORT:
+            res.append(Command('declare-datatypes', [decoder.sorts[arg]]))
+        elif code == ASSERT:
+            res.append(Command('assert', [decoder.nodes[arg]]))
+        elif code in [PUSH, POP]:
+            res.append(Command(COMMAND_NAMES[code], [arg]))
+        elif code in COMMAND_NAMES:
+            res.append(Command(COMMAND_NAMES[code], []))
+        else:
+            raise ExecutionError("Unknown command code: {}".format(code))
+    return res
+
+### Writes Model to binary file opened with 'wb'
+def dump_model(model, file):
+    assert isinstance(model, Model)
+    encoder = Encoder()
+    _encode_model(encoder, model)
+    encoder.write(file, MODEL_MAGIC)
+
+### @return Model
+def load_model(file):
+    decoder = Decoder(file.read(), MODEL_MAGIC)
+    model, _ = _decode_model(decoder, 0)
+    return model
+
+### Serializes state of independent component for Solver (see vega.Parallel)
+### Body is [model..., number of post-constraints, post-constraints..., number of visited variables, visited variables...,
+###          number of solved post-constraints, solved post-constraints...]
+### @param solved_post_constraints: post-constraints not needed to be evaluated again with state of model (see Solver.getSolvedPostConstraints())
+### @return bytes
+def dump_component(model, post_constraints, visited_variables, solved_post_constraints=()):
+    encoder = Encoder()
+    _encode_model(encoder, model)
+    body = encoder.body
+    body.append(len(post_constraints))
+    body.extend([encoder.node(expr) for expr in post_constraints])
+    body.append(len(visited_variables))
+    body.extend([encoder.node(v) for v in visited_variables])
+    body.append(len(solved_post_constraints))
+    body.extend([encoder.node(expr) for expr in solved_post_constraints])
+    out = io.BytesIO()
+    encoder.write(out, COMPONENT_MAGIC)
+    return out.getvalue()
+
+### @param engine: DomainEngine to hold domain objects (if None, new one is created)
+### @return (Model, list of post-constraints, list of visited variables, list of solved post-constraints)
+def load_component(data, engine=None):
+    decoder = Decoder(data, COMPONENT_MAGIC)
+    body, nodes = decoder.body, decoder.nodes
+    model, i = _decode_model(decoder, 0, engine)
+    n = body[i]
+    post_constraints = [nodes[x] for x in body[i + 1:i + 1 + n]]
+    i += 1 + n
+    n = body[i]
+    visited_variables = [nodes[x] for x in body[i + 1:i + 1 + n]]
+    i += 1 + n
+    n = body[i]
+    solved_post_constraints = [nodes[x] for x in body[i + 1:i + 1 + n]]
+    return model, post_constraints, visited_variables, solved_post_constraints
+
+### Body of model is [satisfiability, domain sort, engine name, number of entries, entries...],
+### where entry is (variable, ENTRY_VALUES, n, values...) or (variable, ENTRY_REF, 1, root)
+def _encode_model(encoder, model):
+    body = encoder.body
+    if model.sat == Satisfiability.Sat():
+        sat = SAT
+    elif model.sat == Satisfiability.Unsat():
+        sat = UNSAT
+    else:
+        sat = UNKNOWN
+    body.extend([sat, encoder.sort(model.engine.sort), encoder.string(model.engine.__class__.__name__), len(model.variables)])
+    for key, value in model.variables.items():
+        if isinstance(value, Ref):
+            body.extend([encoder.node(key), ENTRY_REF, 1, encoder.node(model.ref.getRef(key))])
+        else:
+            values = sorted(model.engine.values(value), key=lambda v: v.name)
+            body.extend([encoder.node(key), ENTRY_VALUES, len(values)])
+            body.extend([encoder.node(v) for v in values])
+
+### @return (Model, index of next item of body)
+def _decode_model(decoder, i, engine=None):
+    body, nodes = decoder.body, decoder.nodes
+    sat = [Satisfiability.Sat(), Satisfiability.Unsat(), Satisfiability.Unknown()][body[i]]
+    if engine is None:
+        engine_class = getattr(Domain, decoder.strings[body[i + 2]], None)
+        if not (isinstance(engine_class, type) and issubclass(engine_class, Domain.DomainEngine)):
+            raise ExecutionError("Unknown domain engine: {}".format(decoder.strings[body[i + 2]]))
+        engine = engine_class(decoder.sorts[body[i + 1]])
+    number_of_entries = body[i + 3]
+    i += 4
+
+    ref = RefMap()
+    domains = {} # root -> domain object
+    children = []
+    for _ in range(number_of_entries):
+        key, entry, n = nodes[body[i]], body[i + 1], body[i + 2]
+        args = body[i + 3:i + 3 + n]
+        i += 3 + n
+        if entry == ENTRY_REF:
+            ref.setRef(key, nodes[args[0]])
+            children.append(key)
+        else:
+            domains[key] = engine.of([nodes[x] for x in args])
+
+    ### Root of restored RefMap may differ from original one
+    variables = {}
+    for key, value in domains.items():
+        variables[ref.getRef(key)] = value
+    for key in list(domains.keys()) + children:
+        root = ref.getRef(key)
+        if root is not key:
+            variables[key] = Ref(root)
+    return Model(sat, variables, ref, engine), i
@@ -0,0 +1,74 @@
+from .AST import *
+from .Law import applyDeMorgansLow
+
+### Compiles constraint to flat list of instructions executed by Solver (same as recursive evaluation in Solver.__evaluate() with __and_eq).
+### Operands are interned AST nodes (i.e. variables and values are compared by identity), and results of instructions are joined with `&`.
+###
+### VISIT expr                      Mark variables of expr as constrained (tactic WithReorder only)
+### AND_EQ x a                      x == a
+### UNIFY x y                       x == y
+### NOT_EQ x a                      Not(x == a)
+### OR_BLOCK n (x k a_1..a_k)*n     Or() of x == a_i (values of each x are joined, then intersected with domain of x)
+### BOT                             unsat
+### DEFER expr                      Add If() or Implies() to post-constraints
+### EVAL expr                       Evaluate expr recursively (not compiled expressions, e.g. Or(Not(...)))
+
+VISIT = 0
+AND_EQ = 1
+UNIFY = 2
+NOT_EQ = 3
+OR_BLOCK = 4
+BOT = 5
+DEFER = 6
+EVAL = 7
+
+### @return list of instructions (compiled once for each node)
+def compile_expr(expr):
+    try:
+        return expr._code
+    except AttributeError:
+        code = []
+        if isinstance(expr, Eq) or isinstance(expr, And) or isinstance(expr, Or) or isinstance(expr, Not):
+            code += [VISIT, expr] # Variables of sub-expressions are visited at once
+        _compile(expr, code)
+        expr._code = code
+        return code
+
+def _compile(expr, code):
+    if isinstance(expr, Terminate) or isinstance(expr, Top):
+        return
+    if isinstance(expr, Bot):
+        code.append(BOT)
+    elif isinstance(expr, Eq) and isinstance(expr.v1, Variable) and isinstance(expr.v2, Value):
+        code += [AND_EQ, expr.v1, expr.v2]
+    elif isinstance(expr, Eq) and isinstance(expr.v1, Variable) and isinstance(expr.v2, Variable):
+        code += [UNIFY, expr.v1, expr.v2]
+    elif isinstance(expr, And):
+        for x in expr.v:
+            _compile(x, code)
+    elif isinstance(expr, Or) and all(isinstance(x, Eq) and isinstance(x.v1, Variable) and isinstance(x.v2, Value) for x in expr.v):
+        variables = expr.getVariables()
+        code += [OR_BLOCK, len(variables)]
+        for v in variables: # Same order as Solver.__evaluate()
+            values = [x.v2 for x in expr.v if x.v1 is v]
+            code += [v, len(values)] + values
+    elif isinstance(expr, Not) and isinstance(expr.v1, Eq) and isinstance(expr.v1.v1, Variable) and isinstance(expr.v1.v2, Value):
+        code += [NOT_EQ, expr.v1.v1, expr.v1.v2]
+    elif isinstance(expr, Not) and isinstance(expr.v1, Not):
+        _compile(expr.v1.v1, code)
+    elif isinstance(expr, Not) and (isinstance(expr.v1, And) or isinstance(expr.v1, Or)):
+        _compile(applyDeMorgansLow(expr), code)
+    elif isinstance(expr, If) or isinstance(expr, Implies):
+        code += [DEFER, expr]
+    else: # Raises error or uses semantics of nested expression (e.g. Or(And(...)))
+        code += [EVAL, expr]
+
+### @return True if code consists of AND_EQ and NOT_EQ only (see vega.Batch)
+def is_unit(code):
+    n = len(code)
+    if n < 5 or code[0] != VISIT:
+        return False
+    for i in range(2, n, 3):
+        if code[i] != AND_EQ and code[i] != NOT_EQ:
+            return False
+    return True
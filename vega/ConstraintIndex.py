@@ -0,0 +1,80 @@
+from .AST import *
+
+### Index of constraints stored in Solver to skip redundant ones at Solver.add().
+### A constraint is redundant if the same node (nodes are interned) is already stored, or if it is subsumed by stored units:
+###   Eq(x, a) (or And() having it) subsumes Eq(x, a), Not(Eq(x, b)) (b is not a) and Or(Eq(x, a), Eq(x, b), ...) (disjuncts over x only),
+###   and And() is redundant if all of its conjuncts are.
+### Skipped constraints do not change domains, since stored constraints are evaluated before them.
+class ConstraintIndex:
+    def __init__(self, constraints=()):
+        self.constraints = {} # id(expr) -> [expr, count] (expr is kept to keep id() valid)
+        self.units = {}       # variable -> {id(value): count} of stored Eq(variable, value) including conjuncts of And()
+        for expr in constraints:
+            self.add(expr)
+
+    def __repr__(self):
+        return "{}(constraints={}, units={})".format(self.__class__.__name__, len(self.constraints), len(self.units))
+
+    def __contains__(self, expr):
+        return id(expr) in self.constraints
+
+    ### @return True if expr does not change domains after stored constraints are evaluated
+    def isRedundant(self, expr):
+        if id(expr) in self.constraints:
+            return True
+        cls = expr.__class__
+        if cls is Eq:
+            if isinstance(expr.v2, Value): # e.g. conjunct of stored And()
+                values = self.units.get(expr.v1)
+                return values is not None and id(expr.v2) in values
+            return False
+        if cls is Not:
+            v = expr.v1
+            if v.__class__ is Eq and isinstance(v.v2, Value):
+                values = self.units.get(v.v1)
+                return bool(values) and not id(v.v2) in values
+            return False
+        if cls is Or:
+            x = None
+            found = False
+            for e in expr.v:
+                if not (e.__class__ is Eq and isinstance(e.v2, Value)) or (x is not None and not e.v1 is x):
+                    return False
+                x = e.v1
+                values = self.units.get(x)
+                found = found or (values is not None and id(e.v2) in values)
+            return found
+        if cls is And:
+            return all(self.isRedundant(e) for e in expr.v)
+        return False
+
+    ### Records stored constraint (duplicated ones are counted to be removed one by one)
+    def add(self, expr):
+        entry = self.constraints.get(id(expr))
+        if entry is None:
+            self.constraints[id(expr)] = [expr, 1]
+        else:
+            entry[1] += 1
+        self.__updateUnits(expr, 1)
+
+    ### Forgets constraint recorded by add() (e.g. at Solver.pop())
+    def remove(self, expr):
+        entry = self.constraints[id(expr)]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self.constraints[id(expr)]
+        self.__updateUnits(expr, -1)
+
+    def __updateUnits(self, expr, delta):
+        if expr.__class__ is And:
+            for e in expr.v:
+                self.__updateUnits(e, delta)
+        elif expr.__class__ is Eq and isinstance(expr.v2, Value):
+            values = self.units.setdefault(expr.v1, {})
+            count = values.get(id(expr.v2), 0) + delta
+            if count > 0:
+                values[id(expr.v2)] = count
+            else:
+                del values[id(expr.v2)]
+                if not values:
+                    del self.units[expr.v1]
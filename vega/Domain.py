@@ -0,0 +1,175 @@
+# coding:utf-8
+import abc
+
+from . import AST
+
+### @return ValueError raised by of(), add() and remove() of engines on value out of sort
+def _outOfSort(sort, value):
+    return ValueError("{} is not a value of {}".format(value, sort))
+
+### Domain engine holds candidate values of each variable (i.e. values of `Solver.variables`).
+### Every operation treats domain objects as immutable and returns a new (or shared) object,
+### so that a domain object can be shared by many variables.
+### of(), add() and remove() raise ValueError on values out of self.sort (contains() just returns False).
+class DomainEngine(abc.ABC):
+    def __init__(self, sort):
+        assert isinstance(sort, AST.Sort)
+        self.sort = sort
+
+    def __repr__(self):
+        return "{}({})".format(self.__class__.__name__, self.sort)
+
+    ### @return domain object holds all values of self.sort
+    @abc.abstractmethod
+    def full(self):
+        pass
+
+    ### @return domain object holds given values
+    @abc.abstractmethod
+    def of(self, values):
+        pass
+
+    @abc.abstractmethod
+    def blank(self):
+        pass
+
+    @abc.abstractmethod
+    def singleton(self, value):
+        pass
+
+    @abc.abstractmethod
+    def contains(self, d, value):
+        pass
+
+    @abc.abstractmethod
+    def add(self, d, value):
+        pass
+
+    @abc.abstractmethod
+    def remove(self, d, value):
+        pass
+
+    @abc.abstractmethod
+    def intersect(self, a, b):
+        pass
+
+    ### @return set of AST.Value
+    @abc.abstractmethod
+    def values(self, d):
+        pass
+
+    @abc.abstractmethod
+    def size(self, d):
+        pass
+
+### Domain object is frozenset of AST.Value (default)
+class SetDomain(DomainEngine):
+    def __init__(self, sort):
+        DomainEngine.__init__(self, sort)
+        self._full = frozenset(sort.values)
+        self._blank = frozenset()
+        self._singletons = {} # Share singleton sets among variables
+
+    def full(self):
+        return self._full
+
+    def of(self, values):
+        res = frozenset(values)
+        if not res <= self._full:
+            raise _outOfSort(self.sort, next(iter(res - self._full)))
+        return res
+
+    def blank(self):
+        return self._blank
+
+    def singleton(self, value):
+        res = self._singletons.get(value)
+        if res is None:
+            res = self._singletons[value] = frozenset([value])
+        return res
+
+    def contains(self, d, value):
+        return value in d
+
+    def add(self, d, value):
+        if value in d:
+            return d
+        if not value in self._full:
+            raise _outOfSort(self.sort, value)
+        return d | self.singleton(value)
+
+    def remove(self, d, value):
+        if value in d:
+            return d - self.singleton(value)
+        if not value in self._full:
+            raise _outOfSort(self.sort, value)
+        return d
+
+    def intersect(self, a, b):
+        return a & b
+
+    def values(self, d):
+        return set(d)
+
+    def size(self, d):
+        return len(d)
+
+### Domain object is int bitmask. Each value of sort is assigned to one bit.
+class BitsetDomain(DomainEngine):
+    def __init__(self, sort):
+        DomainEngine.__init__(self, sort)
+        self.bits = {} # AST.Value -> int
+        self.bit_values = {} # int -> AST.Value
+        for i, value in enumerate(sorted(sort.values, key=lambda v: v.name)):
+            bit = 1 << i
+            self.bits[value] = bit
+            self.bit_values[bit] = value
+        self._full = (1 << len(self.bits)) - 1
+
+    def full(self):
+        return self._full
+
+    def of(self, values):
+        res = 0
+        bits = self.bits
+        for value in values:
+            try:
+                res |= bits[value]
+            except KeyError:
+                raise _outOfSort(self.sort, value) from None
+        return res
+
+    def blank(self):
+        return 0
+
+    def singleton(self, value):
+        return self.bits.get(value, 0)
+
+    def contains(self, d, value):
+        return d & self.bits.get(value, 0) != 0
+
+    def add(self, d, value):
+        try:
+            return d | self.bits[value]
+        except KeyError:
+            raise _outOfSort(self.sort, value) from None
+
+    def remove(self, d, value):
+        try:
+            return d & ~self.bits[value]
+        except KeyError:
+            raise _outOfSort(self.sort, value) from None
+
+    def intersect(self, a, b):
+        return a & b
+
+    def values(self, d):
+        res = set()
+        while d:
+            bit = d & -d # lowest set bit
+            res.add(self.bit_values[bit])
+            d ^= bit
+        return res
+
+    def size(self, d):
+        return bin(d).count('1')
@@ -1,16 +1,35 @@
 from .Tactic import Tactic, WithReorder
+from .Domain import DomainEngine, SetDomain
 
 class Feature:
-    def __init__(self, debug=False, tactic=WithReorder()):
+    ### @param parallel: number of worker processes to solve independent components (1 disables multiprocessing).
+    ###        Only post-constraints are solved by workers. Constraints are evaluated by propagate() in main process.
+    ###        NOTE: Worker processes are started on each model() solving more than one changed component and stopped after it (forked workers inherit state of solver at that time),
+    ###              so it costs start-up of N processes per call and pays off only for components of many post-constraints
+    ### @param arc_consistency: prune domains with constraints over few variables before post-constraints are solved (see vega.ArcConsistency).
+    ###        Constraints having If() or Implies() and post-constraints are not revised
+    ### @param simplify: simplify constraints when they are added (see vega.Law.simplify())
+    ### @param deduplicate: skip duplicated and subsumed constraints when they are added (see vega.ConstraintIndex)
+    def __init__(self, debug=False, tactic=WithReorder(), engine=SetDomain, parallel=1, arc_consistency=False, simplify=True, deduplicate=True):
         assert isinstance(debug, bool)
         assert isinstance(tactic, Tactic)
+        assert isinstance(engine, type) and issubclass(engine, DomainEngine)
+        assert isinstance(parallel, int) and parallel >= 1
+        assert isinstance(arc_consistency, bool)
+        assert isinstance(simplify, bool)
+        assert isinstance(deduplicate, bool)
         self.debug = debug
         self.tactic = tactic
+        self.engine = engine
+        self.parallel = parallel
+        self.arc_consistency = arc_consistency
+        self.simplify = simplify
+        self.deduplicate = deduplicate
 
         if self.debug: print("[*] vega.Feature: {}".format(self))
 
     def __repr__(self):
-        return '{}(debug={}, tactic={})'.format(self.__class__.__name__, self.debug, self.tactic)
+        return '{}(debug={}, tactic={}, engine={}, parallel={}, arc_consistency={}, simplify={}, deduplicate={})'.format(self.__class__.__name__, self.debug, self.tactic, self.engine.__name__, self.parallel, self.arc_consistency, self.simplify, self.deduplicate)
 
 class FeatureCapability:
     def __init__(self, feature):
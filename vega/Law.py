@@ -11,4 +11,91 @@ def applyDeMorgansLow(expr):
         return Or(*[Not(e) for e in expr.v1.v])
     if isinstance(expr.v1, Or):
         return And(*[Not(e) for e in expr.v1.v])
-    
\ No newline at end of file
+    
+### Simplifies expression before solving:
+### flattens nested And() and Or(), pushes Not() to atoms (negation normal form), and removes duplicated subterms, Top() and Bot().
+### Results are memoized on interned nodes.
+def simplify(expr):
+    f = _SIMPLIFIERS.get(expr.__class__)
+    if f is None: # Atoms
+        return expr
+    try:
+        return expr._simplified
+    except AttributeError:
+        res = f(expr)
+        expr._simplified = res
+        return res
+
+def _simplifyNOp(expr):
+    cls = expr.__class__
+    if cls is And:
+        unit, zero = Top, Bot
+    else:
+        unit, zero = Bot, Top
+    res = []
+    seen = set() # id() of nodes (nodes are interned)
+    for x in expr.v:
+        x = simplify(x)
+        for y in (x.v if x.__class__ is cls else (x,)): # Flatten
+            if isinstance(y, zero):
+                return zero()
+            if isinstance(y, unit) or id(y) in seen:
+                continue
+            seen.add(id(y))
+            res.append(y)
+    if not res:
+        return unit()
+    if len(res) == 1 and not isinstance(res[0], (If, Implies)): # NOTE: Deferred If() and Implies() are kept wrapped, since And() and Or() visit their variables (tactic WithReorder)
+        return res[0]
+    if len(res) == len(expr.v) and all(x is y for x, y in zip(res, expr.v)):
+        return expr
+    return cls(*res, comment=expr.comment)
+
+def _simplifyIf(expr):
+    cond_clause = simplify(expr.cond_clause)
+    if isinstance(cond_clause, Top):
+        return simplify(expr.then_clause)
+    if isinstance(cond_clause, Bot):
+        return simplify(expr.else_clause)
+    return If(cond_clause, simplify(expr.then_clause), simplify(expr.else_clause))
+
+def _simplifyImplies(expr):
+    left, right = simplify(expr.left), simplify(expr.right)
+    if isinstance(left, Top):
+        return right
+    if isinstance(left, Bot) or isinstance(right, Top):
+        return Top()
+    return Implies(left, right)
+
+def _simplifyNot(expr):
+    v = expr.v1
+    if v.__class__ is Eq:
+        return expr
+    if isinstance(v, Not):
+        return simplify(v.v1)
+    if isinstance(v, And):
+        return simplify(Or(*[Not(x) for x in v.v], comment=v.comment))
+    if isinstance(v, Or):
+        return simplify(And(*[Not(x) for x in v.v], comment=v.comment))
+    if isinstance(v, Terminate):
+        return v
+    if isinstance(v, Top):
+        return Bot()
+    if isinstance(v, Bot):
+        return Top()
+    if isinstance(v, If):
+        return simplify(If(v.cond_clause, Not(v.then_clause), Not(v.else_clause)))
+    if isinstance(v, Implies):
+        return simplify(And(v.left, Not(v.right)))
+    res = simplify(v)
+    if res is v:
+        return expr
+    return simplify(Not(res))
+
+_SIMPLIFIERS = {
+    And: _simplifyNOp,
+    Or: _simplifyNOp,
+    Not: _simplifyNot,
+    If: _simplifyIf,
+    Implies: _simplifyImplies,
+}
@@ -1,5 +1,7 @@
 # coding:utf-8
 
+from array import array
+
 from . import AST
 from .Writer import FileWriter, StringWriter
 
@@ -51,41 +53,132 @@ class VariableToVariableMap:
             return '()'
 
 
-class RefMap(VariableToVariableMap):
+### Union-find of variables. Describes equality x == y |-> Ref(x) = Ref(y).
+### Variables are assigned to int index on first union, and parents are held in int-indexed array.
+### Uses full path compression and union by rank, so that each operation runs in near-constant amortized time.
+### Changes can be undone with push() and pop() (e.g. used by Solver.push() and Solver.pop()).
+class RefMap:
+    def __init__(self):
+        self.index = {}             # AST.Variable -> int
+        self.variables = []         # int -> AST.Variable
+        self.parent = array('l')    # int -> int
+        self.rank = bytearray()     # int -> rank (upper bound of tree height)
+        self.trail = None           # list of (index, old parent, old rank) while scope is opened
+        self.scope_depth = 0
+
+    def __repr__(self):
+        return "{}({})".format(self.__class__.__name__, dict(self.items()))
+
+    def __allocate(self, key):
+        i = self.index.get(key)
+        if i is None:
+            i = len(self.variables)
+            self.index[key] = i
+            self.variables.append(key)
+            self.parent.append(i)
+            self.rank.append(0)
+        return i
+
+    ### @return int: index of root
+    def find(self, i):
+        parent = self.parent
+        root = i
+        while parent[root] != root:
+            root = parent[root]
+        ### Path compression
+        trail = self.trail
+        while parent[i] != root:
+            if trail is not None:
+                trail.append((i, parent[i], self.rank[i]))
+            parent[i], i = root, parent[i]
+        return root
+
     ### @return AST.Variable
-    def getRef(self, key, call_count=0):
-        # assert isinstance(key, AST.Variable)
-        if call_count >= 1000:
-            raise Exception("Dropped in infinite loop at Ref({})".format(key))
-        
-        ref_key = self.get(key, key)
-        if key != ref_key:
-            res = self.getRef(ref_key, call_count + 1)
-            self[ref_key] = res # Memorize result
-            return res
-        else:
-            return key # Fixed point
+    def getRef(self, key):
+        i = self.index.get(key)
+        if i is None:
+            return key # Not unified with any variables
+        return self.variables[self.find(i)]
 
-    ### @return AST.Variable: Ref of child (= `ref[child]`) 
-    ### Eq(x, y) |-> x -> y, where x = child and y = Ref(parent)
+    ### @return AST.Variable: Ref of child (= Ref of parent)
+    ### Eq(x, y) |-> Ref(x) = Ref(y), where x = child and y = parent
+    ### NOTE: Root of merged tree is chosen by rank, so it can be either Ref(child) or Ref(parent)
     def setRef(self, child, parent):
         assert isinstance(child, AST.Variable), "ref: {} -> {}".format(child, parent)
         assert isinstance(parent, AST.Variable), "ref: {} -> {}".format(child, parent)
-        
-        x = child                       # x
-        y = self.getRef(parent)         # y = Ref(parent)
-        z = self.getRef(x)              # x'
-
-        ### Assume x is reflective: Ref(x) = x
-        if x == z:                      # Do not use too slow `x in self`
-            # assert x.name != "File_9_0" or not y.name.startswith("Reg_7ff"), "x={}, y={}".format(x, y) # DEBUG
-            self[x] = y                 # x == y
-            return y                    # return Ref(x)
-        
-        ### Redirect relation of (child, parent) since parent is refferenced another child.
-        ### Do not check $y != z$ because it calls Variable.__eq__()) and slows execution.
-        ### i.e. ∀(x,y,z), {x == y, x == z} ~> {y == z, x == z} (allows x == y or y == z)
+
+        x = self.find(self.__allocate(child))
+        y = self.find(self.__allocate(parent))
+        if x == y:
+            return self.variables[x]
+
+        ### Union by rank: attach lower tree to higher tree
+        rank = self.rank
+        if rank[x] > rank[y]:
+            x, y = y, x
+        if self.trail is not None:
+            self.trail.append((x, x, rank[x]))
+            self.trail.append((y, y, rank[y]))
+        self.parent[x] = y
+        if rank[x] == rank[y]:
+            rank[y] += 1
+        return self.variables[y]
+
+    ### @return independent RefMap holding same equalities
+    def copy(self):
+        res = RefMap.__new__(RefMap)
+        res.index = self.index.copy()
+        res.variables = self.variables[:]
+        res.parent = array('l', self.parent)
+        res.rank = bytearray(self.rank)
+        res.trail = None if self.trail is None else self.trail[:]
+        res.scope_depth = self.scope_depth
+        return res
+
+    ### Opens scope to record changes
+    ### @return mark to be passed to pop()
+    def push(self):
+        if self.trail is None:
+            self.trail = []
+        self.scope_depth += 1
+        return len(self.trail)
+
+    ### Undoes changes after push() returned `mark`
+    def pop(self, mark):
+        trail = self.trail
+        assert trail is not None and mark <= len(trail)
+        while len(trail) > mark:
+            i, parent, rank = trail.pop()
+            self.parent[i] = parent
+            self.rank[i] = rank
+        self.scope_depth -= 1
+        if self.scope_depth == 0: # Outermost scope is closed
+            self.trail = None
+
+    ### @return iterator of (variable, Ref(variable)) for variables not referencing itself
+    def items(self):
+        for i, key in enumerate(self.variables):
+            root = self.find(i)
+            if root != i:
+                yield key, self.variables[root]
+
+    def __iter__(self):
+        return (key for key, _ in self.items())
+
+    def __len__(self):
+        return sum(1 for _ in self.items())
+
+    def __bool__(self):
+        return len(self.variables) > 0
+
+    def dump(self, file=None):
+        if file:
+            out = FileWriter(file)
         else:
-            # assert y.name != "File_9_0" or not z.name.startswith("Reg_7ff"), "y={}, z={}".format(y, z) # DEBUG
-            self[y] = z                 # y == z
-            return z                    # return Ref(x)
+            out = StringWriter()
+        if len(self.variables) > 0:
+            for k, v in self.items():
+                out.write('{} -> {}'.format(k, v))
+            return out.finalize()
+        else:
+            return '()'
@@ -1,36 +1,114 @@
 # coding:utf-8
+import re
+
 from . import AST
 from .Map import RefMap
 from .Satisfiability import Satisfiability, Sat
+from .Domain import DomainEngine
+from .Writer import BufferedWriter, StringWriter
 
+### Read-only view of solver state: `variables` and `ref` are shared with Solver without copy,
+### so the view reflects later changes of the solver (e.g. add() and pop()). Use freeze() to keep the model.
 class Model(dict):
-    def __init__(self, sat, variables, ref):
+    def __init__(self, sat, variables, ref, engine):
         assert isinstance(sat, Satisfiability)
         assert isinstance(ref, RefMap)
         assert isinstance(variables, dict) # Map Variable -> set を型にしたい
+        assert isinstance(engine, DomainEngine)
         self.sat = sat
         self.ref = ref
-        self.variables = {} # ダンプを簡単にするために専用dictを用意して使いたい
-        for key, value in variables.items():
-            self.variables[key] = value
+        self.engine = engine
+        self.variables = variables # Not copied (see freeze())
+        self.frozen = False
+
+    ### @return Model detached from solver (copy of variables and ref)
+    def freeze(self):
+        if self.frozen:
+            return self
+        res = Model(self.sat, self.variables.copy(), self.ref.copy(), self.engine)
+        res.frozen = True
+        return res
 
     def __repr__(self):
         if len(self.variables) < 100:
-            return "{}(sat={}, {})".format(self.__class__.__name__, self.sat, self.variables)
+            return "{}(sat={}, {})".format(self.__class__.__name__, self.sat, {k: self.__describe(v) for k, v in self.variables.items()})
         else: # Avoid too long output
             return "{}(sat={}, ...)".format(self.__class__.__name__, self.sat)
-    
+
+    def __describe(self, value):
+        if isinstance(value, AST.Ref):
+            return value
+        return self.engine.values(value)
+
+    ### @return set of AST.Value
     def __getitem__(self, key):
         ref_key = self.ref.getRef(key)
         if ref_key in self.variables:
-            return self.variables[ref_key]
+            return self.engine.values(self.variables[ref_key])
         else:
             return None
 
     def __setitem__(self, key, value):
         # print("[*] Model::__setitem__(key={}, value={})".format(key, value)) # DEBUG
-        assert isinstance(value, set) or isinstance(value, AST.Ref) # 専用の型を用意したい
+        assert isinstance(value, (set, frozenset)) or isinstance(value, AST.Ref) # 専用の型を用意したい
+        if not isinstance(value, AST.Ref):
+            value = self.engine.of(value)
+        if not self.frozen: # Detach from solver before modification
+            self.variables = self.variables.copy()
+            self.ref = self.ref.copy()
+            self.frozen = True
         self.variables[self.ref.getRef(key)] = value
 
+    ### @return iterator of (variable, set of AST.Value) with Ref() followed to root
+    def items(self):
+        getRef = self.ref.getRef
+        variables = self.variables
+        values = self.engine.values
+        for key, value in variables.items():
+            if isinstance(value, AST.Ref):
+                value = variables[getRef(key)]
+            yield key, values(value)
+
+    def __iter__(self):
+        return iter(self.variables)
+
+    def __len__(self):
+        return len(self.variables)
+
     def __bool__(self):
-        return isinstance(self.sat, Sat)
\ No newline at end of file
+        return isinstance(self.sat, Sat)
+
+    ### Writes model as response of get-model command of SMT-LIB (values are written as `(or a b)` if not unique).
+    ### Variables are walked once, and values of each root are formatted once for all variables referencing it.
+    ### @param prefix: writes only variables of which names start with prefix
+    ### @param pattern: writes only variables of which names match regular expression (str or compiled)
+    def to_smt2(self, file=None, prefix=None, pattern=None):
+        if file:
+            out = BufferedWriter(file)
+        else:
+            out = StringWriter()
+        match = None if pattern is None else re.compile(pattern).match
+
+        getRef = self.ref.getRef
+        variables = self.variables
+        values = self.engine.values
+        answers = {} # id(root) -> formatted values
+        out.write("(model")
+        for key, value in variables.items():
+            name = key.name
+            if prefix is not None and not name.startswith(prefix):
+                continue
+            if match is not None and not match(name):
+                continue
+            root = getRef(key) if isinstance(value, AST.Ref) else key
+            ans = answers.get(id(root))
+            if ans is None:
+                vs = values(variables[root])
+                if len(vs) > 1:
+                    ans = "(or {})".format(' '.join([x.name for x in vs]))
+                else:
+                    ans = next(iter(vs)).name
+                answers[id(root)] = ans
+            out.write("  (define-fun {name} () {sort_name}\n    (as {ans} {sort_name}))".format(name=name, sort_name=key.sort.name, ans=ans))
+        out.write(")")
+        return out.finalize()
@@ -0,0 +1,94 @@
+import copy
+import gc
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from . import BinaryFormat
+from .Model import Model
+
+### Solving independent components in worker processes (see Feature(parallel=N)).
+### Results are sent back from workers in binary format of vega.BinaryFormat.
+### On platforms supporting fork(), workers inherit state of solver and components are sent as list of indices of post-constraints.
+### Otherwise components (and variables in them) are sent in binary format too.
+
+### Number of batches per worker. Small components are packed into batches to amortize cost of inter-process communication.
+BATCHES_PER_WORKER = 4
+
+### Solver inherited by forked worker processes
+_forked_solver = None
+
+### Splits components into at most n batches of similar number of post-constraints
+### @param components: list of (root, list of post-constraint) (see Partition.getDirtyComponents())
+### @return list of list of component
+def split_into_batches(components, n):
+    batches = [[] for _ in range(min(n, len(components)))]
+    sizes = [0] * len(batches)
+    for component in sorted(components, key=lambda c: -len(c[1])): # Largest first
+        i = sizes.index(min(sizes))
+        batches[i].append(component)
+        sizes[i] += len(component[1])
+    return [batch for batch in batches if batch]
+
+### Runs in forked worker process
+### @param components: list of list of index of post-constraints
+### @return bytes built by BinaryFormat.dump_component() holding result
+def solve_batch(components):
+    return _forked_solver.solveBatch(components)
+
+### Runs in worker process
+### @param data: bytes built by BinaryFormat.dump_component()
+### @return bytes built by BinaryFormat.dump_component() holding result
+def solve_component(feature, data):
+    from .Solver import Solver, unknown
+    model, post_constraints, visited_variables, _ = BinaryFormat.load_component(data)
+    feature = copy.copy(feature)
+    feature.parallel = 1 # Worker does not start workers
+    solver = Solver(model.engine.sort, feature)
+    solver.engine = model.engine
+    solver.variables = model.variables
+    solver.ref = model.ref
+    solver.post_constraints = list(post_constraints)
+    solver.visited_variables = set(map(solver.ref.getRef, visited_variables)) # Roots of restored RefMap
+    solver.partition = None # Rebuilt from post-constraints
+    solver.satisfiability = unknown
+    res = solver.model()
+    return BinaryFormat.dump_component(
+        Model(res.sat, solver.variables, solver.ref, solver.engine),
+        solver.post_constraints[len(post_constraints):], solver.visited_variables,
+        solver.getSolvedPostConstraints(solver.post_constraints)
+        )
+
+### Pool of worker processes bound to solver
+class Pool:
+    def __init__(self, solver):
+        self.solver = solver
+        self.executor = None
+        self.forked = 'fork' in multiprocessing.get_all_start_methods()
+
+    def __enter__(self):
+        global _forked_solver
+        if self.forked:
+            _forked_solver = self.solver
+            gc.freeze() # Keeps garbage collector of workers from touching (and copying) inherited objects
+            self.executor = ProcessPoolExecutor(self.solver.feature.parallel, mp_context=multiprocessing.get_context('fork'))
+        else:
+            self.executor = ProcessPoolExecutor(self.solver.feature.parallel)
+        return self
+
+    def __exit__(self, *exc):
+        global _forked_solver
+        self.executor.shutdown(wait=True)
+        self.executor = None
+        if self.forked:
+            gc.unfreeze()
+        _forked_solver = None
+        return False
+
+    ### @param components: list of list of index of post-constraints
+    ### @return Future of bytes built by BinaryFormat.dump_component()
+    def submit(self, components):
+        if self.forked:
+            return self.executor.submit(solve_batch, components)
+        post_constraints = [self.solver.post_constraints[i] for indices in components for i in indices]
+        variables = set(v for expr in post_constraints for v in expr.getVariables())
+        return self.executor.submit(solve_component, self.solver.feature, self.solver.dumpComponent(variables, post_constraints))
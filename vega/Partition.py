@@ -0,0 +1,128 @@
+from .Map import RefMap
+
+### Partition of constraints into connected components of constraint graph.
+### Constraints sharing variables (directly or through other constraints) belong to same component,
+### and each component is identified by root variable of union-find `self.ref` (None for constraints without variables).
+### Components are independent of each other, so Solver.model() solves post-constraints of dirty components only.
+### Changes can be undone with push() and pop() (e.g. used by Solver.push() and Solver.pop()).
+class Partition:
+    def __init__(self):
+        self.ref = RefMap()         # Union-find of variables
+        self.post_constraints = {}  # root -> list of index of Solver.post_constraints
+        self.dirty = set()          # Variables (or None) of which components are changed after last solve
+        self.scopes = []            # list of (size of trail, mark of self.ref, copy of self.dirty)
+        self.trail = []             # Changes of self.post_constraints while scope is opened
+
+    def __repr__(self):
+        return "{}(components={}, dirty={})".format(self.__class__.__name__, len(self.post_constraints), len(self.dirty))
+
+    ### Builds partition of existing constraints
+    ### @param dirty: mark all components as dirty
+    @staticmethod
+    def build(constraints, post_constraints, dirty):
+        res = Partition()
+        for expr in constraints:
+            res.addConstraint(expr)
+        for i, expr in enumerate(post_constraints):
+            res.addPostConstraint(i, expr)
+        if not dirty:
+            res.dirty.clear()
+        return res
+
+    ### @return root of component
+    def getRoot(self, variables):
+        root = None
+        for v in variables:
+            if root is None:
+                root = self.ref.getRef(v)
+            else:
+                root = self.__union(root, v)
+        return root
+
+    def __union(self, root, v):
+        ref = self.ref
+        other = ref.getRef(v)
+        if other is root:
+            return root
+        new_root = ref.setRef(v, root)
+        child = other if new_root is root else root
+
+        ### Move post-constraints of child to new root (smaller list is appended to larger one)
+        lists = self.post_constraints
+        root_list = lists.pop(new_root, None)
+        child_list = lists.pop(child, None)
+        extended, n = None, 0
+        if root_list and child_list:
+            if len(root_list) >= len(child_list):
+                extended, appended = root_list, child_list
+            else:
+                extended, appended = child_list, root_list
+            n = len(extended)
+            extended.extend(appended)
+            lists[new_root] = extended
+        elif root_list or child_list:
+            lists[new_root] = root_list or child_list
+        if self.scopes:
+            self.trail.append(('union', new_root, child, root_list, child_list, extended, n))
+        return new_root
+
+    def addConstraint(self, expr):
+        self.dirty.add(self.getRoot(expr.getVariables()))
+
+    ### @param i: index of expr in Solver.post_constraints
+    def addPostConstraint(self, i, expr):
+        root = self.getRoot(expr.getVariables())
+        lst = self.post_constraints.get(root)
+        if lst is None:
+            lst = self.post_constraints[root] = []
+            if self.scopes:
+                self.trail.append(('list', root))
+        lst.append(i)
+        if self.scopes:
+            self.trail.append(('append', root))
+        self.dirty.add(root)
+
+    ### @return list of (root, sorted list of index of post-constraints) of dirty components, ordered by first post-constraint
+    def getDirtyComponents(self):
+        getRef = self.ref.getRef
+        self.dirty = set(getRef(v) if v is not None else None for v in self.dirty) # Roots of merged components
+        res = []
+        for root in list(self.dirty):
+            lst = self.post_constraints.get(root)
+            if lst:
+                res.append((root, sorted(lst)))
+            else:
+                self.dirty.discard(root) # Nothing to solve
+        res.sort(key=lambda x: x[1][0])
+        return res
+
+    ### Marks component as solved
+    def clean(self, root):
+        self.dirty.discard(root)
+
+    ### Opens scope to record changes
+    def push(self):
+        self.scopes.append((len(self.trail), self.ref.push(), set(self.dirty)))
+
+    ### Undoes changes after matching push()
+    def pop(self):
+        size, ref_mark, dirty = self.scopes.pop()
+        lists = self.post_constraints
+        trail = self.trail
+        while len(trail) > size:
+            entry = trail.pop()
+            if entry[0] == 'append':
+                lists[entry[1]].pop()
+            elif entry[0] == 'list':
+                del lists[entry[1]]
+            else: # Union
+                _, root, child, root_list, child_list, extended, n = entry
+                if extended is not None:
+                    del extended[n:]
+                lists.pop(root, None)
+                if root_list is not None:
+                    lists[root] = root_list
+                if child_list is not None:
+                    lists[child] = child_list
+        self.ref.pop(ref_mark)
+        self.dirty = dirty
@@ -0,0 +1,68 @@
+import heapq
+
+### Scheduler of post-constraints for tactic WithReorder.
+### Post-constraints are numbered by their order in queue, and each waiting one watches one of its unvisited condition variables.
+### When the variable is visited, only post-constraints watching it are woken.
+### Ready post-constraints are picked in cyclic order starting next to last picked one,
+### and if nothing is ready, the first waiting one in same order is picked (forced).
+class Scheduler:
+    def __init__(self, n):
+        self.size = n
+        self.remaining = n
+        self.alive = list(range(n + 1)) # i -> smallest alive index >= i (n is sentinel)
+        self.watches = {}               # variable -> list of index of waiting post-constraints
+        self.ahead = []                 # Heap of ready indices after self.position
+        self.behind = []                # Heap of ready indices before self.position (picked after wrap around)
+        self.position = -1              # Index of last picked post-constraint
+
+    def __repr__(self):
+        return "{}(remaining={}, ready={}, watches={})".format(self.__class__.__name__, self.remaining, len(self.ahead) + len(self.behind), len(self.watches))
+
+    def __bool__(self):
+        return self.remaining > 0
+
+    ### @return smallest alive index >= i (self.size if nothing)
+    def __findAlive(self, i):
+        alive = self.alive
+        root = i
+        while alive[root] != root:
+            root = alive[root]
+        while alive[i] != root: # Path compression
+            alive[i], i = root, alive[i]
+        return root
+
+    def isAlive(self, i):
+        return self.__findAlive(i) == i
+
+    ### Makes i-th post-constraint wait until variable is visited
+    def wait(self, i, variable):
+        self.watches.setdefault(variable, []).append(i)
+
+    ### @return list of index of alive post-constraints waiting for variable
+    def wake(self, variable):
+        return [i for i in self.watches.pop(variable, []) if self.isAlive(i)]
+
+    def ready(self, i):
+        heapq.heappush(self.ahead if i > self.position else self.behind, i)
+
+    ### Picks post-constraint to be evaluated next
+    ### @return (index, True if picked without being ready)
+    def next(self):
+        assert self.remaining > 0
+        while self.ahead or self.behind:
+            if not self.ahead: # Wrap around
+                self.ahead, self.behind = self.behind, []
+            i = heapq.heappop(self.ahead)
+            if self.isAlive(i):
+                self.__pick(i)
+                return i, False
+        i = self.__findAlive(self.position + 1)
+        if i == self.size: # Wrap around
+            i = self.__findAlive(0)
+        self.__pick(i)
+        return i, True
+
+    def __pick(self, i):
+        self.alive[i] = i + 1
+        self.position = i
+        self.remaining -= 1
@@ -0,0 +1,25 @@
+### Marks value of absent key in trail
+MISSING = object()
+
+### State of Solver at push(). Solver.pop() restores state with this.
+class Scope:
+    def __init__(self, trail_size, ref_mark, visited_trail_size, constraints_size, post_constraints_size, model_start, satisfiability, constraint_satisfiability, saved_variables, partition):
+        self.trail_size = trail_size                        # Size of Solver.trail
+        self.ref_mark = ref_mark                            # Mark of RefMap.push()
+        self.visited_trail_size = visited_trail_size        # Size of Solver.visited_trail
+        self.constraints_size = constraints_size
+        self.post_constraints_size = post_constraints_size
+        self.model_start = model_start
+        self.satisfiability = satisfiability
+        self.constraint_satisfiability = constraint_satisfiability
+        self.saved_variables = saved_variables              # Variables saved to trail in outer scope
+        self.partition = partition                          # Partition opened scope at push() (or None)
+
+    def copy(self):
+        res = Scope.__new__(Scope)
+        res.__dict__.update(self.__dict__)
+        res.saved_variables = set(self.saved_variables)
+        return res
+
+    def __repr__(self):
+        return "{}(constraints_size={}, trail_size={})".format(self.__class__.__name__, self.constraints_size, self.trail_size)
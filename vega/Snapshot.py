@@ -0,0 +1,54 @@
+### Copy of Solver state taken by Solver.snapshot() and restored by Solver.restore().
+### Containers are copied but domains and AST nodes are shared, since they are immutable.
+### Snapshot itself is never modified, so that it can be restored many times.
+class Snapshot:
+    def __init__(self, solver):
+        self.domain = solver.domain
+        self.engine = solver.engine
+        self.variables = solver.variables.copy()
+        self.ref = solver.ref.copy()
+        self.constraints = solver.constraints[:]
+        self.post_constraints = solver.post_constraints[:]
+        self.visited_variables = solver.visited_variables.copy()
+        self.scopes = [scope.copy() for scope in solver.scopes]
+        self.trail = solver.trail[:]
+        self.visited_trail = solver.visited_trail[:]
+        self.saved_variables = solver.saved_variables.copy()
+        self.satisfiability = solver.satisfiability
+        self.constraint_satisfiability = solver.constraint_satisfiability
+        self.model_start = solver.model_start
+
+    def __repr__(self):
+        return "{}(constraints={}, satisfiability={})".format(self.__class__.__name__, len(self.constraints), self.satisfiability)
+
+    ### Writes copy of this snapshot to solver.
+    ### Containers are handed over without copy if `move` is True (then this snapshot must not be used anymore).
+    def restoreTo(self, solver, move=False):
+        solver.engine = self.engine
+        solver.partition = None # Rebuilt on demand
+        solver.index = None # Rebuilt on demand
+        if move:
+            solver.variables = self.variables
+            solver.ref = self.ref
+            solver.constraints = self.constraints
+            solver.post_constraints = self.post_constraints
+            solver.visited_variables = self.visited_variables
+            solver.scopes = self.scopes
+            solver.trail = self.trail
+            solver.visited_trail = self.visited_trail
+            solver.saved_variables = self.saved_variables
+        else:
+            solver.variables = self.variables.copy()
+            solver.ref = self.ref.copy()
+            solver.constraints = self.constraints[:]
+            solver.post_constraints = self.post_constraints[:]
+            solver.visited_variables = self.visited_variables.copy()
+            solver.scopes = [scope.copy() for scope in self.scopes]
+            solver.trail = self.trail[:]
+            solver.visited_trail = self.visited_trail[:]
+            solver.saved_variables = self.saved_variables.copy()
+        solver.satisfiability = self.satisfiability
+        solver.constraint_satisfiability = self.constraint_satisfiability
+        solver.model_start = self.model_start
+        solver.held_units = 0
+        solver.post_signatures = {} # Evaluated again on demand
@@ -1,10 +1,23 @@
 import sys
 from functools import reduce
+from concurrent.futures import as_completed
 
 from .Exceptions import *
 from . import AST
-from .Law import applyDeMorgansLow
+from .Law import applyDeMorgansLow, simplify
 from .Map import RefMap
+from .Scope import Scope, MISSING
+from .Snapshot import Snapshot
+from .Partition import Partition
+from .ConstraintIndex import ConstraintIndex
+from .Scheduler import Scheduler
+from .WatchList import WatchList
+from . import Parallel
+from . import ArcConsistency
+from . import Compiler
+from . import Batch
+from .Compiler import compile_expr
+from . import BinaryFormat
 from .Model import Model
 from . import Satisfiability
 from .Feature import Feature, FeatureCapability
@@ -23,16 +36,31 @@ class Solver(FeatureCapability, SmtlibCapability, ProfileCapability):
         assert isinstance(feature, Feature)
         self.domain = domain
         FeatureCapability.__init__(self, feature)
+        self.engine = self.feature.engine(domain)
 
         self.variables = {}
-        self.ref = RefMap({})
+        self.sort_domains = {} # id(sort) -> (sort, engine, domain of values in sort)
+        self.ref = RefMap()
         self.constraints = []
         self.post_constraints = []
         self.visited_variables = set()
+        self.partition = Partition() # Built lazily if None
+        self.index = ConstraintIndex() if self.feature.deduplicate else None # Built lazily if None
+        self.post_queue = None # Post-constraints of component being solved
+        self.visit_queue = None # Variables visited while scheduler is running (see vega.Scheduler)
+        self.changed_variables = None # variable -> value before evaluation of post-constraint (see vega.WatchList)
+
+        ### For push() and pop()
+        self.scopes = []
+        self.trail = [] # list of (variable, old value of self.variables[variable])
+        self.visited_trail = [] # Variables added to self.visited_variables in scope
+        self.saved_variables = set() # Variables saved to trail in current scope
 
         self.satisfiability = unknown # For optimization
+        self.constraint_satisfiability = sat # Satisfiability of constraints evaluated by propagate()
         self.model_start = 0 # For optimization
-        self.model_post_start = 0 # For optimization
+        self.held_units = 0 # Number of unit constraints from self.model_start held by propagate(hold_units=True)
+        self.post_signatures = {} # id(post-constraint) -> (post-constraint, roots and domains of its variables after last evaluation)
 
         # print("Solver.ref = {}".format(self.ref)) # DEBUG
         assert not self.ref # Expect ref is blank
@@ -40,22 +68,152 @@ class Solver(FeatureCapability, SmtlibCapability, ProfileCapability):
     def declareVariable(self, v):
         assert isinstance(v, AST.Variable)
         if not v in self.variables:
-            self.variables[v] = set(self.domain.values)
-            ## Exclude values not v.sort holds
-            if not v.sort == self.domain:
-                self.__addPostConstraint(AST.And(*[AST.Not(AST.Eq(v, t)) for t in self.domain.values - v.sort.values]))
+            if v.sort == self.domain:
+                self.__assign(v, self.engine.full())
+            else: ## Exclude values not v.sort holds
+                self.__assign(v, self.__getSortDomain(v.sort))
+                if isinstance(self.feature.tactic, Tactic.WithReorder): self.__visit([v]) # Same as evaluation of restriction
+
+    ### @return initial domain of variables of sort (shared by variables of same sort)
+    def __getSortDomain(self, sort):
+        entry = self.sort_domains.get(id(sort))
+        if entry is None or not entry[1] is self.engine:
+            entry = self.sort_domains[id(sort)] = (sort, self.engine, self.engine.of(self.domain.values & sort.values))
+        return entry[2]
 
     def add(self, *expr_list):
         for expr in expr_list:
             assert isinstance(expr, AST.AST), "expr={}".format(expr)
+            if self.feature.simplify:
+                expr = simplify(expr)
+            if self.feature.deduplicate:
+                index = self.__getIndex()
+                if index.isRedundant(expr): # Does not change model
+                    continue
+                index.add(expr)
             self.constraints.append(expr)
             for v in expr.getVariables():
                 self.declareVariable(v)
-        self.satisfiability = unknown
+            self.__getPartition().addConstraint(expr)
+            self.satisfiability = unknown
+
+    ### @return ConstraintIndex of current constraints
+    def __getIndex(self):
+        if self.index is None:
+            self.index = ConstraintIndex(self.constraints)
+        return self.index
+
+    ### @return Partition of current constraints
+    ### NOTE: Components are clean only if stored satisfiability is sat (e.g. restored unsat solver must solve all components again)
+    def __getPartition(self):
+        if self.partition is None:
+            self.partition = Partition.build(self.constraints, self.post_constraints, self.satisfiability != sat)
+        return self.partition
+
+    ### Updates self.variables[key]. Old value is recorded to trail once per scope.
+    def __assign(self, key, value):
+        if self.scopes and not key in self.saved_variables:
+            self.saved_variables.add(key)
+            self.trail.append((key, self.variables.get(key, MISSING)))
+        if self.changed_variables is not None and not key in self.changed_variables:
+            self.changed_variables[key] = self.variables.get(key, MISSING)
+        self.variables[key] = value
+
+    ### Marks variables as constrained
+    def __visit(self, variables):
+        refs = set(map(self.ref.getRef, variables)) - self.visited_variables
+        if self.scopes:
+            self.visited_trail.extend(refs)
+        if self.visit_queue is not None: # Notify scheduler
+            self.visit_queue.extend(refs)
+        self.visited_variables |= refs
 
     def __addPostConstraint(self, expr):
         assert isinstance(expr, AST.AST)
         self.post_constraints.append(expr)
+        self.__getPartition().addPostConstraint(len(self.post_constraints) - 1, expr)
+        if self.post_queue is not None: # Added while solving component (e.g. nested If)
+            self.post_queue.append(expr)
+
+    ### Evaluates constraints added after last evaluation (without post-constraints).
+    ### Lets callers interleave add() and evaluation of constraints (e.g. while parsing).
+    ### @param hold_units: leave trailing unit constraints fewer than Batch.MIN_BATCH_SIZE to be evaluated by later call,
+    ###        so that units added one by one are applied in batch (check() and model() evaluate all of them)
+    ### @return sat or unsat (of evaluated constraints)
+    def propagate(self, hold_units=False):
+        if self.constraint_satisfiability == unsat:
+            return unsat
+        debug = self.feature.debug
+        i = self.model_start
+        known = i + self.held_units # Constraints before this are known to be units
+        self.held_units = 0
+        while i < len(self.constraints): # Optimization
+            ### Apply consecutive unit constraints at once (evaluated one by one if batch gets unsat)
+            end = max(i, known)
+            while end < len(self.constraints) and Compiler.is_unit(compile_expr(self.constraints[end])):
+                end += 1
+            if end - i >= Batch.MIN_BATCH_SIZE and self.__applyUnitConstraints(self.constraints[i:end]):
+                i = end
+                continue
+            if hold_units and end == len(self.constraints) and end - i < Batch.MIN_BATCH_SIZE: # Wait for more units
+                self.held_units = end - i
+                break
+            end = max(end, i + 1)
+
+            for i in range(i, end):
+                expr = self.constraints[i]
+                try:
+                    if debug and i > 0 and i % 1000000 == 0: print("[*] Solver::propagate(): Solving constraint #{}".format(i)) # DEBUG
+                    res = self.__execute(compile_expr(expr))
+                    if debug: assert res == sat
+                    if res == unsat:
+                        self.constraint_satisfiability = unsat
+                        return unsat
+                except Exception as e:
+                    sys.stdout.flush()
+                    print("[X] TheoremSolver::propagate(): Exception occured in constraint #{}: {}".format(i, expr))
+                    raise e
+            i = end
+        self.model_start = i # Optimization
+        return sat
+
+    ### Applies unit constraints in batch (see vega.Batch)
+    ### @return True if applied, or False if some variable gets blank (nothing is changed)
+    def __applyUnitConstraints(self, constraints):
+        ### Variables are indexed by id() since nodes are interned (hashing AST nodes is slower)
+        indices = {} # id(variable) -> index of variable
+        variables = []
+        rows, values, polarities = [], [], []
+        AND_EQ = Compiler.AND_EQ
+        for expr in constraints:
+            code = compile_expr(expr)
+            for k in range(2, len(code), 3):
+                v = code[k + 1]
+                row = indices.get(id(v))
+                if row is None:
+                    row = indices[id(v)] = len(variables)
+                    variables.append(v)
+                rows.append(row)
+                values.append(code[k + 2])
+                polarities.append(code[k] == AND_EQ)
+
+        ### Variables sharing root share a row
+        root_rows = {}
+        row_map = [root_rows.setdefault(self.ref.getRef(v), len(root_rows)) for v in variables]
+        if len(root_rows) < len(variables):
+            rows = [row_map[row] for row in rows]
+        roots = list(root_rows)
+
+        domains = [self.variables[root] for root in roots]
+        if any(isinstance(d, AST.Ref) for d in domains):
+            return False
+        res = Batch.apply_units([self.engine.values(d) for d in domains], rows, values, polarities)
+        if res is None:
+            return False
+        if isinstance(self.feature.tactic, Tactic.WithReorder): self.__visit(roots)
+        for row, values in sorted(res.items()):
+            self.__assign(roots[row], self.engine.of(values))
+        return True
 
     def check(self):
         if self.satisfiability == unknown:
@@ -68,128 +226,355 @@ class Solver(FeatureCapability, SmtlibCapability, ProfileCapability):
 
     ### @return Model
     def model(self):
-        def __model_constraints(self, debug):
-            for i, expr in enumerate(self.constraints[self.model_start:]): # Optimization
+        def __model_post_constraints(self, debug):
+            ### Components not changed after last solve are skipped, and solving stops at first unsat component
+            partition = self.__getPartition()
+            components = partition.getDirtyComponents()
+            if self.feature.parallel > 1 and len(components) > 1:
+                self.satisfiability = self.__solveComponentsInParallel(components)
+                return self.satisfiability
+            for root, post_constraints in components:
+                self.post_queue = [self.post_constraints[i] for i in post_constraints]
                 try:
-                    if debug and i > 0 and i % 1000000 == 0: print("[*] Solver::model(): Solving constraint #{}".format(i)) # DEBUG
-                    self.satisfiability = self.__evaluate(expr, self.__and_eq)
-                    if debug: assert self.satisfiability == sat
-                    if self.satisfiability == unsat:
-                        break
+                    res = self.__solvePostConstraints(self.post_queue)
+                finally:
+                    self.post_queue = None
+                if res == unsat:
+                    self.satisfiability = unsat
+                    return unsat
+                partition.clean(root)
+            self.satisfiability = sat
+            return sat
+        
+        debug = self.feature.debug
+
+        if self.satisfiability == unknown: # Optimization
+            self.__getPartition() # Build partition (if needed) before satisfiability is updated
+
+            ### Prune domains before and after constraints are processed
+            start = self.model_start
+            if self.feature.arc_consistency and self.constraint_satisfiability == sat:
+                self.constraint_satisfiability = self.__pruneDomains(self.constraints[start:])
+
+            ### Process constraints
+            self.satisfiability = self.propagate()
+
+            if self.satisfiability == sat and self.feature.arc_consistency:
+                self.satisfiability = self.__pruneDomains(self.constraints[start:])
+
+            if self.satisfiability == sat:
+                ### Process post-constraints
+                __model_post_constraints(self, debug)
+            else:
+                if debug: assert False
+
+        return Model(self.satisfiability, self.variables, self.ref, self.engine)
+
+    ### Makes domains arc consistent on constraints (post-constraints are not revised, see vega.ArcConsistency)
+    ### @param constraints: constraints evaluated by last propagate()
+    ### @return sat/unsat
+    def __pruneDomains(self, constraints):
+        def __set_domain(root, domain):
+            self.__assign(root, domain)
+        if ArcConsistency.prune(constraints, self.engine, self.ref.getRef, lambda root: self.variables[root], __set_domain):
+            return sat
+        else:
+            return unsat
+
+    ### Solves post-constraints of a component (new post-constraints are appended to `post_constraints` while solving)
+    ### @return sat/unsat
+    def __solvePostConstraints(self, post_constraints):
+        debug = self.feature.debug
+
+        ### Algprithm for reordering problem (P(y, x), Q(z), R(z, y) should solved Q, R, P)
+        ### But requires self.visited_variables to manage constrained variables (requied much memory?)
+        ### Post-constraints with condition variables are evaluated after all the variables are visited (see vega.Scheduler)
+        ### @return sat/unsat
+        def __with_reordering_constraints(self, post_constraints, debug):
+            unvisited_post_constraints = []
+            for i, expr in enumerate(post_constraints):
+                try:
+                    if not expr.getConditionVariables():
+                        self.satisfiability = self.__evaluate_post(expr)
+                        if self.satisfiability == unsat:
+                            return unsat
+                        # visited_variables |= expr.getVariables()
+                    else:
+                        unvisited_post_constraints.append(expr)
                 except Exception as e:
                     sys.stdout.flush()
-                    print("[X] TheoremSolver::model::__model_constraints(): Exception occured in constraint #{}: {}".format(i, expr))
+                    print("[X] TheoremSolver::model::__model_post_constraints(): Exception occured in post-constraint #{}: {}".format(i, expr))
                     raise e
- 
-        def __model_post_constraints(self, debug):
-            ### Algprithm for reordering problem (P(y, x), Q(z), R(z, y) should solved Q, R, P)
-            ### But requires self.visited_variables to manage constrained variables (requied much memory?)
-            ### @return sat/unsat
-            def __with_reordering_constraints(self, debug):
-                visited_variables = self.visited_variables
-                unvisited_post_constraints = []
-                for i, expr in enumerate(self.post_constraints):
-                    try:
-                        if not expr.getConditionVariables():
-                            self.satisfiability = self.__evaluate_post(expr)
-                            if self.satisfiability == unsat:
-                                return
-                            # visited_variables |= expr.getVariables()
-                        else:
-                            unvisited_post_constraints.append(expr)
-                    except Exception as e:
-                        sys.stdout.flush()
-                        print("[X] TheoremSolver::model::__model_post_constraints(): Exception occured in post-constraint #{}: {}".format(i, expr))
-                        raise e
-                
-                # print("unvisited_post_constraints = {}".format(unvisited_post_constraints)) # DEBUG
-                skip_stop = len(unvisited_post_constraints)
-                for i, expr in enumerate(unvisited_post_constraints):
+            
+            ### Post-constraints waiting for condition variables are woken when the variables are visited
+            scheduler = Scheduler(len(unvisited_post_constraints))
+            for i, expr in enumerate(unvisited_post_constraints):
+                self.__schedule(scheduler, i, expr)
+            self.visit_queue = []
+            try:
+                while scheduler:
+                    ### If no post-constraints are ready, give up determing condition variables from other constraints
+                    i, _ = scheduler.next()
+                    expr = unvisited_post_constraints[i]
                     try:
                         if debug and i > 0 and i % 1000000 == 0: print("[*] Solver::model(): Solving unvisited post-constraint #{}".format(i)) # DEBUG
-                        
-                        cond_vars = set(map(lambda v: self.ref.getRef(v), expr.getConditionVariables()))
-                        # print("cond_vars = {}".format(cond_vars)) # DEBUG
-                        # print("visited_variables = {}".format(visited_variables)) # DEBUG
-
-                        ### Give up determing vars in cond_vars from other constraints if i is bigger than length of original unvisited_post_constraints
-                        if cond_vars & visited_variables == cond_vars or i >= skip_stop: # intersection
-                            self.satisfiability = self.__evaluate_post(expr)
-                            if self.satisfiability == unsat:
-                                return
-                            visited_variables |= set(map(lambda v: self.ref.getRef(v), expr.getVariables()))
-                            skip_stop = len(unvisited_post_constraints)
-                        else:
-                            # print("unvisited_post_constraints: push {}".format(expr)) # DEBUG
-                            unvisited_post_constraints.append(expr) # Push to last of iterator
+                        self.satisfiability = self.__evaluate_post(expr)
+                        if self.satisfiability == unsat:
+                            return unsat
+                        self.__visit(expr.getVariables())
                     except Exception as e:
                         print("[X] TheoremSolver::__model_post_constraints(): Exception occured in expression #{}: {}".format(i, expr))
                         raise e
-                return self.satisfiability
-
-            ### @return sat/unsat
-            def __simple(self, debug):
-                for i, expr in enumerate(self.post_constraints):
+                    for v in self.visit_queue:
+                        for j in scheduler.wake(v):
+                            self.__schedule(scheduler, j, unvisited_post_constraints[j])
+                    del self.visit_queue[:]
+            finally:
+                self.visit_queue = None
+            return self.satisfiability
+
+        ### @return sat/unsat
+        def __simple(self, post_constraints, debug):
+            for i, expr in enumerate(post_constraints):
+                try:
+                    if debug and i > 0 and i % 1000000 == 0: print("[*] Solver::model(): Solving post-constraint #{}".format(i)) # DEBUG
+                    self.satisfiability = self.__evaluate_post(expr)
+                    if debug: assert self.satisfiability == sat
+                    if self.satisfiability == unsat:
+                        return unsat
+                except Exception as e:
+                    print("[X] TheoremSolver::model(): Exception occured in post-constraint #{}: {}".format(i, expr))
+                    raise e
+            return self.satisfiability
+
+        ### @return sat/unsat
+        def __fixpoint(self, post_constraints, debug):
+            watch_list = WatchList()
+            watch_list.extend(post_constraints)
+            self.changed_variables = {}
+            try:
+                while watch_list:
+                    i = watch_list.pop()
+                    expr = post_constraints[i]
                     try:
-                        if debug and i > 0 and i % 1000000 == 0: print("[*] Solver::model(): Solving post-constraint #{}".format(i)) # DEBUG
                         self.satisfiability = self.__evaluate_post(expr)
-                        if debug: assert self.satisfiability == sat
                         if self.satisfiability == unsat:
                             return unsat
                     except Exception as e:
                         print("[X] TheoremSolver::model(): Exception occured in post-constraint #{}: {}".format(i, expr))
                         raise e
-                return self.satisfiability
-
-            ### Without reordeing
-            if isinstance(self.feature.tactic, Tactic.Simple):
-                return __simple(self, debug)
-
-            ### Iterate 2 times to solve reordering problem (but CANNOT support If statements)
-            if isinstance(self.feature.tactic, Tactic.Simple2):
-                res = __simple(self, debug)
-                if res == unsat:
+                    watch_list.watch(i, map(self.ref.getRef, expr.getConditionVariables()))
+                    for key, old in self.changed_variables.items():
+                        if self.__isNarrowed(old, self.variables[key]):
+                            watch_list.notify(key)
+                    self.changed_variables.clear()
+                    watch_list.extend(post_constraints) # e.g. nested If
+            finally:
+                self.changed_variables = None
+            return self.satisfiability
+
+        ### Without reordeing
+        if isinstance(self.feature.tactic, Tactic.Simple):
+            return __simple(self, post_constraints, debug)
+
+        ### Iterate 2 times to solve reordering problem (but CANNOT support If statements)
+        if isinstance(self.feature.tactic, Tactic.Simple2):
+            res = __simple(self, post_constraints, debug)
+            if res == unsat:
+                return unsat
+            else:
+                return __simple(self, post_constraints, debug)
+
+        ### With reordering
+        if isinstance(self.feature.tactic, Tactic.WithReorder):
+            return __with_reordering_constraints(self, post_constraints, debug)
+
+        ### Until fixpoint
+        if isinstance(self.feature.tactic, Tactic.Fixpoint):
+            return __fixpoint(self, post_constraints, debug)
+
+        raise UnhandledCaseError("Unhandled tactic = {}".format(self.feature.tactic))
+
+    ### Domains only shrink while evaluating constraints, so changes other than narrowing are ignored to ensure termination of Tactic.Fixpoint
+    ### @return True if domain `new` is narrower than `old` or variable is joined to other tree
+    def __isNarrowed(self, old, new):
+        if isinstance(new, AST.Ref):
+            return not new is old
+        if old is MISSING or isinstance(old, AST.Ref):
+            return False
+        return self.engine.size(new) < self.engine.size(old)
+
+    ### Makes post-constraint ready if all of its condition variables are visited, or wait for one of them otherwise
+    def __schedule(self, scheduler, i, expr):
+        for v in expr.getConditionVariables():
+            root = self.ref.getRef(v)
+            if not root in self.visited_variables:
+                scheduler.wait(i, root)
+                return
+        scheduler.ready(i)
+
+    ### Solves components in worker processes and merges results
+    ### @param components: list of (root, list of index of post-constraints)
+    ### @return sat/unsat
+    def __solveComponentsInParallel(self, components):
+        partition = self.__getPartition()
+        batches = Parallel.split_into_batches(components, self.feature.parallel * Parallel.BATCHES_PER_WORKER)
+        results = {}
+        with Parallel.Pool(self) as pool:
+            futures = {}
+            for i, batch in enumerate(batches):
+                futures[pool.submit([indices for _, indices in batch])] = i
+            for future in as_completed(futures):
+                result = BinaryFormat.load_component(future.result(), self.engine)
+                if not result[0].sat:
+                    for f in futures:
+                        f.cancel()
                     return unsat
-                else:
-                    return __simple(self, debug)
-            
-            ### With reordering
-            if isinstance(self.feature.tactic, Tactic.WithReorder):
-                return __with_reordering_constraints(self, debug)
-            
-            raise UnhandledCaseError("Unhandled tactic = {}".format(self.feature.tactic))
-        
-        debug = self.feature.debug
-
-        if self.satisfiability == unknown: # Optimization
-            ### Process constraints
-            __model_constraints(self, debug)
-
-            if self.satisfiability == sat:
-                self.model_start = len(self.constraints) # Optimization
+                results[futures[future]] = result
 
-                ### NG: produces infinite loop
-                # for expr in self.post_constraints:
-                #     if expr.getConditionVariables():
-                #         unvisited_variables = expr.getVariables() - expr.getConditionVariables()
-                #         self.visited_variables -= set(map(lambda v: self.ref.getRef(v), unvisited_variables))
-
-                ### Process post-constraints
-                __model_post_constraints(self, debug)
+        ### Merge in order of batches to keep result deterministic
+        for i, batch in enumerate(batches):
+            self.__mergeComponent(*results[i])
+            for root, _ in batch:
+                partition.clean(root)
+        return sat
 
-                # if self.satisfiability == sat:
-                #     self.model_post_start = len(self.post_constraints) # Optimization
-            else:
-                if debug: assert False
+    ### Solves components and serializes result (used by worker processes of vega.Parallel)
+    ### @param components: list of list of index of post-constraints
+    ### @return bytes built by BinaryFormat.dump_component() holding state of variables and new post-constraints
+    def solveBatch(self, components):
+        start = len(self.post_constraints)
+        getRef = self.ref.getRef
+        changed = set()
+        solved = []
+        for indices in components:
+            self.post_queue = [self.post_constraints[i] for i in indices]
+            variables = set(v for expr in self.post_queue for v in expr.getVariables())
+            before = dict((v, (getRef(v), self.variables[getRef(v)], getRef(v) in self.visited_variables)) for v in variables)
+            try:
+                res = self.__solvePostConstraints(self.post_queue)
+            finally:
+                self.post_queue = None
+            if res == unsat:
+                return BinaryFormat.dump_component(Model(unsat, {}, self.ref, self.engine), [], [])
+            ### Only changed variables are sent back to reduce cost of serialization
+            for v, (root, value, visited) in before.items():
+                new_root = getRef(v)
+                if not new_root is root or not self.variables[new_root] is value or visited != (new_root in self.visited_variables):
+                    changed.add(v)
+            solved += self.getSolvedPostConstraints([self.post_constraints[i] for i in indices])
+        solved += self.getSolvedPostConstraints(self.post_constraints[start:])
+        return self.dumpComponent(changed, self.post_constraints[start:], solved)
+
+    ### @return post-constraints of which variables are not changed after their last evaluation (see __evaluate_post())
+    def getSolvedPostConstraints(self, post_constraints):
+        res = []
+        for expr in post_constraints:
+            signature = self.post_signatures.get(id(expr))
+            if signature is not None and signature[1] == self.__getSignature(expr):
+                res.append(expr)
+        return res
 
-        return Model(self.satisfiability, self.variables, self.ref)
+    ### @param variables: variables to be dumped
+    ### @param new_post_constraints: post-constraints to be sent with variables
+    ### @param solved_post_constraints: post-constraints not needed to be evaluated again (see getSolvedPostConstraints())
+    ### @return bytes holding state of variables
+    def dumpComponent(self, variables, new_post_constraints, solved_post_constraints=()):
+        res = {}
+        roots = set()
+        for v in variables:
+            root = self.ref.getRef(v)
+            roots.add(root)
+            if not root is v:
+                res[v] = AST.Ref(root)
+        for root in roots:
+            res[root] = self.variables[root]
+        visited_variables = [v for v in roots if v in self.visited_variables]
+        return BinaryFormat.dump_component(Model(sat, res, self.ref, self.engine), new_post_constraints, visited_variables, solved_post_constraints)
+
+    ### Writes result of component solved by worker process
+    ### Signatures of post-constraints solved by worker are recorded as if they were evaluated in this process (see __evaluate_post())
+    def __mergeComponent(self, model, new_post_constraints, visited_variables, solved_post_constraints):
+        ### Join trees joined by worker
+        for key, value in model.variables.items():
+            if isinstance(value, AST.Ref):
+                ref_key = self.ref.getRef(key)
+                ref_value = self.ref.getRef(value.variable)
+                if not ref_key is ref_value:
+                    root = self.ref.setRef(key, value.variable)
+                    self.__assign(ref_value if root is ref_key else ref_key, AST.Ref(root))
+        for key, value in model.variables.items():
+            if not isinstance(value, AST.Ref):
+                self.__assign(self.ref.getRef(key), value)
+        self.__visit(visited_variables)
+        for expr in new_post_constraints: # e.g. nested If
+            self.__addPostConstraint(expr)
+        for expr in solved_post_constraints:
+            self.post_signatures[id(expr)] = (expr, self.__getSignature(expr))
+
+    ### Takes copy of current state (including evaluated constraints) to be restored later
+    ### @return Snapshot
+    def snapshot(self):
+        return Snapshot(self)
+
+    ### Restores state taken by snapshot(). Same snapshot can be restored many times.
+    def restore(self, snapshot):
+        assert isinstance(snapshot, Snapshot)
+        if not snapshot.domain == self.domain:
+            raise ExecutionError("Snapshot of another domain: {} != {}".format(snapshot.domain, self.domain))
+        snapshot.restoreTo(self)
+
+    ### @return new Solver having copy of current state. Changes to either solver do not affect the other.
+    def fork(self):
+        res = Solver(self.domain, self.feature)
+        self.snapshot().restoreTo(res, move=True) # Snapshot is copy and not shared with others
+        return res
 
+    ### Opens new scope. Changes after push() are undone by pop().
     def push(self):
-        raise ExecutionError('Implement me')
-
+        self.scopes.append(Scope(
+            len(self.trail), self.ref.push(), len(self.visited_trail),
+            len(self.constraints), len(self.post_constraints),
+            self.model_start, self.satisfiability, self.constraint_satisfiability,
+            self.saved_variables, self.partition,
+            ))
+        self.saved_variables = set()
+        if self.partition is not None:
+            self.partition.push()
+
+    ### Restores state at matching push() in time proportional to changes in the scope
     def pop(self):
-        raise ExecutionError('Implement me')
-        self.satisfiability = unknown
+        if not self.scopes:
+            raise ExecutionError("pop() without push()")
+        scope = self.scopes.pop()
+
+        trail = self.trail
+        while len(trail) > scope.trail_size:
+            key, value = trail.pop()
+            if value is MISSING:
+                del self.variables[key]
+            else:
+                self.variables[key] = value
+        self.ref.pop(scope.ref_mark)
+        visited_trail = self.visited_trail
+        while len(visited_trail) > scope.visited_trail_size:
+            self.visited_variables.discard(visited_trail.pop())
+        if self.index is not None:
+            for expr in self.constraints[scope.constraints_size:]:
+                self.index.remove(expr)
+        del self.constraints[scope.constraints_size:]
+        del self.post_constraints[scope.post_constraints_size:]
+
+        self.model_start = scope.model_start
+        self.held_units = 0
+        self.satisfiability = scope.satisfiability
+        self.constraint_satisfiability = scope.constraint_satisfiability
+        self.saved_variables = scope.saved_variables
+        self.post_signatures = {} # Post-constraints evaluated in scope may have added nested ones removed above
+        if self.partition is not None and self.partition is scope.partition:
+            self.partition.pop()
+        else: # Rebuilt in scope (e.g. by restore())
+            self.partition = None
 
     def dumpConstraint(self, file=None):
         if file:
@@ -218,6 +603,8 @@ class Solver(FeatureCapability, SmtlibCapability, ProfileCapability):
         else:
             out = StringWriter()
         for k, v in self.variables.items():
+            if not isinstance(v, AST.Ref):
+                v = self.engine.values(v)
             out.write('{} = {}'.format(k, v))
         return out.finalize()
 
@@ -229,43 +616,56 @@ class Solver(FeatureCapability, SmtlibCapability, ProfileCapability):
         assert isinstance(right, AST.Value) or isinstance(right, AST.Variable)
         
         if isinstance(right, AST.Value):
-            ref_left = self.ref.getRef(left)
-            variables_ref_left = self.variables[ref_left]
-            if isinstance(variables_ref_left, set) and not right in variables_ref_left: # Check intersection is not blank
-                ### e.g. And(x == {Int}, y == x, y == {Pointer}) is unsat
-                # print("[*] __and_eq(left={}, right={}): unsat".format(left, right)) # DEBUG
-                # print("[*] __and_eq: variables = {}".format(self.variables)) # DEBUG
-                if self.feature.debug: print("[!] __and_eq: symvar Ref({}) = {} cannot be {}".format(left, ref_left, right))
-                return unsat
-            self.variables[ref_left] = set([right])
-            return sat
-        
+            return self.__and_eq_value(left, right)
         elif isinstance(right, AST.Variable):
-            if left != right: ### NOTE: Dismiss identical assign (i.e. x == x)
-                # print("[*] self.variables[left] = AST.Ref(right): left={} right={}".format(left, right)) # DEBUG
-
-                ref_left = self.ref.setRef(left, right)
-                variables_left = self.variables[left]
+            return self.__unify(left, right)
 
-                ### Handle lazy binding (i.e. late y == x)
-                if isinstance(variables_left, set) and isinstance(self.variables[ref_left], set):
-                    ### i.e. {y |-> {a}} |- {y == a} ~> {x |-> {a}} |- {y == a, y == x}
-                    self.variables[ref_left] &= variables_left # intersection
+    ### x == a
+    def __and_eq_value(self, left, right):
+        ref_left = self.ref.getRef(left)
+        variables_ref_left = self.variables[ref_left]
+        if not isinstance(variables_ref_left, AST.Ref) and not self.engine.contains(variables_ref_left, right): # Check intersection is not blank
+            ### e.g. And(x == {Int}, y == x, y == {Pointer}) is unsat
+            # print("[*] __and_eq(left={}, right={}): unsat".format(left, right)) # DEBUG
+            # print("[*] __and_eq: variables = {}".format(self.variables)) # DEBUG
+            if self.feature.debug: print("[!] __and_eq: symvar Ref({}) = {} cannot be {}".format(left, ref_left, right))
+            return unsat
+        self.__assign(ref_left, self.engine.singleton(right))
+        return sat
 
-                if left != ref_left:
-                    self.variables[left] = AST.Ref(right)
+    ### x == y
+    def __unify(self, left, right):
+        ref_left = self.ref.getRef(left)
+        ref_right = self.ref.getRef(right)
+        if ref_left != ref_right: ### NOTE: Dismiss identical assign (i.e. x == x)
+            # print("[*] self.variables[left] = AST.Ref(right): left={} right={}".format(left, right)) # DEBUG
+            variables_ref_left = self.variables[ref_left]
+            variables_ref_right = self.variables[ref_right]
+            assert not isinstance(variables_ref_left, AST.Ref), "self.variables[{}] = {}".format(ref_left, variables_ref_left)
+            assert not isinstance(variables_ref_right, AST.Ref), "self.variables[{}] = {}".format(ref_right, variables_ref_right)
+
+            ### Join two trees and move values to new root (i.e. late y == x is also handled)
+            ### i.e. {y |-> {a}} |- {y == a} ~> {x |-> {a}} |- {y == a, y == x}
+            root = self.ref.setRef(left, right)
+            if root == ref_left:
+                child = ref_right
+            else:
+                child = ref_left
+            self.__assign(root, self.engine.intersect(variables_ref_left, variables_ref_right))
+            self.__assign(child, AST.Ref(root))
 
-                if not self.variables[ref_left]: # blank
-                    return unsat
+            if not self.variables[root]: # blank
+                return unsat
 
-            return sat
+        return sat
 
     ### @return: sat or unsat
     def __or_eq(self, left, right):
         assert isinstance(left, AST.Variable), "type(left)={}".format(type(left))
         assert isinstance(right, AST.Value), "type(right)={}".format(type(right))
         
-        self.variables[self.ref.getRef(left)].add(right)
+        ref_left = self.ref.getRef(left)
+        self.__assign(ref_left, self.engine.add(self.variables[ref_left], right))
         return sat
 
     ### @return: sat or unsat
@@ -273,15 +673,11 @@ class Solver(FeatureCapability, SmtlibCapability, ProfileCapability):
         assert isinstance(left, AST.Variable)
         assert isinstance(right, AST.Value)
         
-        ### NOTE: set::remove(key) emits KeyError if set contains key
         ref_left = self.ref.getRef(left)
         variables_ref_left = self.variables[ref_left]
-        assert isinstance(variables_ref_left, set), "self.variables[{}] = {}".format(ref_left, variables_ref_left)
+        assert not isinstance(variables_ref_left, AST.Ref), "self.variables[{}] = {}".format(ref_left, variables_ref_left)
         
-        if right in variables_ref_left:
-            # self.variables[ref_left] &= ref_left.sort.values - set([right]) # intersection
-            # self.variables[ref_left] &= self.domain.values - set([right]) # intersection
-            self.variables[ref_left].remove(right)
+        self.__assign(ref_left, self.engine.remove(variables_ref_left, right))
         
         if self.variables[ref_left]:
             return sat
@@ -308,10 +704,10 @@ class Solver(FeatureCapability, SmtlibCapability, ProfileCapability):
                 ref_v1 = self.ref.getRef(expr.v1)
                 variables_ref_v1 = self.variables[ref_v1]
                 
-                if not isinstance(variables_ref_v1, set): # Buggy case variables = {x = Ref(y)}, Ref(y) = x
+                if isinstance(variables_ref_v1, AST.Ref): # Buggy case variables = {x = Ref(y)}, Ref(y) = x
                     raise ExecutionError("self.variables[{}] = {}".format(ref_v1, variables_ref_v1))
                 
-                if expr.v2 in variables_ref_v1:
+                if self.engine.contains(variables_ref_v1, expr.v2):
                     return sat
                 else:
                     return unsat
@@ -347,9 +743,9 @@ class Solver(FeatureCapability, SmtlibCapability, ProfileCapability):
         assert isinstance(expr, AST.If)
         res = sat
         ### Assume cond is true
-        res &= self.__evaluate(expr.cond_clause, self.__and_eq)
+        res &= self.__execute(compile_expr(expr.cond_clause))
         if self.feature.debug: assert res == sat # DEBUG
-        res &= self.__evaluate(expr.then_clause, self.__and_eq)
+        res &= self.__execute(compile_expr(expr.then_clause))
         if self.feature.debug: assert res == sat # DEBUG
         return res
 
@@ -362,9 +758,9 @@ class Solver(FeatureCapability, SmtlibCapability, ProfileCapability):
         res = sat
         ### Assume cond is false
         not_cond_expr = applyDeMorgansLow(AST.Not(expr.cond_clause))
-        res &= self.__evaluate(not_cond_expr, self.__and_eq)
+        res &= self.__execute(compile_expr(not_cond_expr))
         if not res == sat: print("[!] Solver::__if_else(expr={}): Not(if-cond) is {}".format(expr, res)) # DEBUG
-        res &= self.__evaluate(expr.else_clause, self.__and_eq)
+        res &= self.__execute(compile_expr(expr.else_clause))
         if self.feature.debug: assert res == sat # DEBUG
         return res
 
@@ -382,28 +778,45 @@ class Solver(FeatureCapability, SmtlibCapability, ProfileCapability):
         prev_set = self.variables[ref_x] # NOTE: And(x == a, Or(x == b, x == c})) => unsat
         if isinstance(prev_set, AST.Ref):
             # print("[!] prev_set is not type set (potential bug). Assume ref_x is not constrained: prev_set={}, ref.get({})={}".format(prev_set, x, ref_x)) # DEBUG
-            prev_set = set(ref_x.sort.values) # Assume prev_set is not constrainted
+            prev_set = self.engine.of(ref_x.sort.values) # Assume prev_set is not constrainted
         
         ### Create new type set
-        self.variables[ref_x] = set() # Set blank to collect OR conditions on symvar ref_x
+        self.__assign(ref_x, self.engine.blank()) # Set blank to collect OR conditions on symvar ref_x
         for v in filter(lambda e: x in e.getVariables(), expr.v):
             res = self.__evaluate(v, self.__or_eq)
             if res == unsat:
-                self.variables[ref_x] = prev_set # Restore state for debugging
+                self.__assign(ref_x, prev_set) # Restore state for debugging
                 if self.feature.debug: raise UnsatException("expression {} produces unsat".format(v))
                 return unsat
         
         ### Merge old set and new set
         current_set = self.variables[ref_x]
-        update_set = prev_set & current_set # intersection
+        update_set = self.engine.intersect(prev_set, current_set)
         # print("[*] Solver::__evaluate(expr={}): ref_x={}, update_set={}".format(expr, ref_x, update_set)) # DEBUG
         
         if update_set:
-            self.variables[ref_x] = update_set
+            self.__assign(ref_x, update_set)
             return sat
         else: # Blank
-            if self.feature.debug: print("[!] __or_on_x: symvar Ref({}) = {} cannot be any values (prev={}, current={})".format(x, ref_x, prev_set, current_set))
-            self.variables[ref_x] = prev_set # Restore state for debugging
+            if self.feature.debug: print("[!] __or_on_x: symvar Ref({}) = {} cannot be any values (prev={}, current={})".format(x, ref_x, self.engine.values(prev_set), self.engine.values(current_set)))
+            self.__assign(ref_x, prev_set) # Restore state for debugging
+            if self.feature.debug: raise UnsatException("variables[{}] is blank".format(ref_x))
+            return unsat
+
+    ### Same as self.__or_on_x() on Or() of x == a (a in values)
+    def __or_values(self, x, values):
+        ref_x = self.ref.getRef(x)
+        prev_set = self.variables[ref_x]
+        if isinstance(prev_set, AST.Ref):
+            prev_set = self.engine.of(ref_x.sort.values) # Assume prev_set is not constrainted
+        current_set = self.engine.of(values)
+        update_set = self.engine.intersect(prev_set, current_set)
+        if update_set:
+            self.__assign(ref_x, update_set)
+            return sat
+        else: # Blank
+            if self.feature.debug: print("[!] __or_on_x: symvar Ref({}) = {} cannot be any values (prev={}, current={})".format(x, ref_x, self.engine.values(prev_set), self.engine.values(current_set)))
+            self.__assign(ref_x, prev_set) # Restore state for debugging
             if self.feature.debug: raise UnsatException("variables[{}] is blank".format(ref_x))
             return unsat
 
@@ -427,19 +840,19 @@ class Solver(FeatureCapability, SmtlibCapability, ProfileCapability):
             return unsat
         
         if isinstance(expr, AST.Eq):
-            if isinstance(self.feature.tactic, Tactic.WithReorder): self.visited_variables |= set(map(lambda v: self.ref.getRef(v), expr.getVariables()))
+            if isinstance(self.feature.tactic, Tactic.WithReorder): self.__visit(expr.getVariables())
             return self.__eq(expr, func)
         
         if isinstance(expr, AST.And):
-            if isinstance(self.feature.tactic, Tactic.WithReorder): self.visited_variables |= set(map(lambda v: self.ref.getRef(v), expr.getVariables()))
+            if isinstance(self.feature.tactic, Tactic.WithReorder): self.__visit(expr.getVariables())
             return reduce(lambda r, x: r & self.__evaluate(x, self.__and_eq), expr.v, sat)
     
         if isinstance(expr, AST.Or):
-            if isinstance(self.feature.tactic, Tactic.WithReorder): self.visited_variables |= set(map(lambda v: self.ref.getRef(v), expr.getVariables()))
+            if isinstance(self.feature.tactic, Tactic.WithReorder): self.__visit(expr.getVariables())
             return reduce(lambda r, x: r | self.__or_on_x(expr, x), expr.getVariables(), unsat)
         
         if isinstance(expr, AST.Not):
-            if isinstance(self.feature.tactic, Tactic.WithReorder): self.visited_variables |= set(map(lambda v: self.ref.getRef(v), expr.getVariables()))
+            if isinstance(self.feature.tactic, Tactic.WithReorder): self.__visit(expr.getVariables())
             if isinstance(expr.v1, AST.Eq): # Not(Eq())
                 return self.__eq(expr.v1, self.__not_eq)
             if isinstance(expr.v1, AST.Not): # Not(Not())
@@ -459,8 +872,73 @@ class Solver(FeatureCapability, SmtlibCapability, ProfileCapability):
 
         raise UnhandledCaseError('expr: {}'.format(expr))
     
+    ### Executes instructions built by Compiler.compile_expr() (same as self.__evaluate(expr, self.__and_eq))
+    ### @return sat/unsat
+    def __execute(self, code):
+        res = sat
+        i = 0
+        n = len(code)
+        while i < n:
+            op = code[i]
+            if op == Compiler.AND_EQ:
+                res &= self.__and_eq_value(code[i + 1], code[i + 2])
+                i += 3
+            elif op == Compiler.NOT_EQ:
+                res &= self.__not_eq(code[i + 1], code[i + 2])
+                i += 3
+            elif op == Compiler.UNIFY:
+                res &= self.__unify(code[i + 1], code[i + 2])
+                i += 3
+            elif op == Compiler.VISIT:
+                if isinstance(self.feature.tactic, Tactic.WithReorder): self.__visit(code[i + 1].getVariables())
+                i += 2
+            elif op == Compiler.OR_BLOCK:
+                r = unsat
+                i += 2
+                for _ in range(code[i - 1]):
+                    k = code[i + 1]
+                    r |= self.__or_values(code[i], code[i + 2:i + 2 + k])
+                    i += 2 + k
+                res &= r
+            elif op == Compiler.DEFER:
+                if isinstance(code[i + 1], AST.If) and isinstance(self.feature.tactic, Tactic.Simple2):
+                    raise ExecutionError("If statement is not supported by tactic {}".format(self.feature.tactic))
+                self.__addPostConstraint(code[i + 1])
+                i += 2
+            elif op == Compiler.BOT:
+                res &= unsat
+                i += 1
+            elif op == Compiler.EVAL:
+                res &= self.__evaluate(code[i + 1], self.__and_eq)
+                i += 2
+            else:
+                raise UnhandledCaseError("op={}".format(op))
+        return res
+
     ### Post phase evaluation
+    ### Post-constraint is skipped if roots and domains of its variables are not changed after last evaluation,
+    ### since evaluating it again with same domains changes nothing (e.g. add() and check() are interleaved)
     def __evaluate_post(self, expr):
+        signature = self.post_signatures.get(id(expr))
+        if signature is not None and signature[1] == self.__getSignature(expr):
+            return sat
+        res = self.__evaluate_post_constraint(expr)
+        if res == sat:
+            self.post_signatures[id(expr)] = (expr, self.__getSignature(expr))
+        return res
+
+    ### @return tuple of roots and domains of variables of expr
+    def __getSignature(self, expr):
+        getRef = self.ref.getRef
+        variables = self.variables
+        res = []
+        for v in expr.getVariables():
+            root = getRef(v)
+            res.append(root)
+            res.append(variables[root])
+        return tuple(res)
+
+    def __evaluate_post_constraint(self, expr):
         if isinstance(expr, AST.If):
             return self.__if(expr)
         if isinstance(expr, AST.Implies):
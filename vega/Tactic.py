@@ -14,4 +14,7 @@ class Simple2(Tactic):
     pass
 
 class WithReorder(Tactic):
-    pass
\ No newline at end of file
+    pass
+### Re-evaluates post-constraints when domains of their condition variables are changed until nothing changes (see vega.WatchList)
+class Fixpoint(Tactic):
+    pass
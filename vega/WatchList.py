@@ -0,0 +1,44 @@
+from collections import deque
+
+### Worklist of post-constraints for tactic Fixpoint.
+### Each post-constraint watches roots of its condition variables, and is queued again when one of them is changed.
+class WatchList:
+    def __init__(self):
+        self.watches = {}    # variable -> set of index of post-constraints
+        self.queue = deque() # Indices of post-constraints to be evaluated
+        self.queued = set()
+        self.seen = set()    # Post-constraints pushed by extend()
+        self.size = 0        # Length of list of post-constraints given to last extend()
+
+    def __repr__(self):
+        return "{}(queued={}, watches={})".format(self.__class__.__name__, len(self.queue), len(self.watches))
+
+    def __bool__(self):
+        return len(self.queue) > 0
+
+    def push(self, i):
+        if not i in self.queued:
+            self.queued.add(i)
+            self.queue.append(i)
+
+    def pop(self):
+        i = self.queue.popleft()
+        self.queued.discard(i)
+        return i
+
+    ### Queues post-constraints appended to list after last call (duplicated ones are skipped since first ones are already watched)
+    def extend(self, post_constraints):
+        for i in range(self.size, len(post_constraints)):
+            if not post_constraints[i] in self.seen:
+                self.seen.add(post_constraints[i])
+                self.push(i)
+        self.size = len(post_constraints)
+
+    def watch(self, i, variables):
+        for v in variables:
+            self.watches.setdefault(v, set()).add(i)
+
+    ### Queues post-constraints watching variable
+    def notify(self, variable):
+        for i in sorted(self.watches.pop(variable, ())):
+            self.push(i)
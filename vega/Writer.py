@@ -19,4 +19,28 @@ class FileWriter(Writer):
         self.out.write(content + '\n')
     
     def finalize(self):
-        return None
\ No newline at end of file
+        return None
+
+### Writes lines to file in large chunks instead of one write() per line (e.g. model of million variables)
+class BufferedWriter(Writer):
+    def __init__(self, file, buffer_size=1 << 16):
+        self.out = file
+        self.buffer = []
+        self.size = 0 # Number of characters in buffer
+        self.buffer_size = buffer_size
+
+    def write(self, content):
+        self.buffer.append(content)
+        self.size += len(content) + 1
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.out.write('\n'.join(self.buffer) + '\n')
+            self.buffer = []
+            self.size = 0
+
+    def finalize(self):
+        self.flush()
+        return None
@@ -4,6 +4,7 @@ from .Functions import *
 
 from .Feature import Feature
 from . import Tactic
+from . import Domain
 
 from .smtlib import *
 
@@ -1,7 +1,8 @@
 import sys
 import argparse
 
-from .smtlib.app import evaluate_smt2_file
+from .smtlib.app import evaluate_smt2_file, evaluate_binary_file, compile_smt2_file
+from .BinaryFormat import SCRIPT_MAGIC
 
 def usage(parser):
     parser.print_help(sys.stderr)
@@ -15,15 +16,33 @@ def main():
     parser.add_argument("-in", dest="_in", action="store_true", help='read formula from standard input')
     parser.add_argument("file", nargs="?")
     parser.add_argument("--profile", action="store_true")
+    parser.add_argument("--model-prefix", metavar="PREFIX", help='get-model writes only variables of which names start with PREFIX (e.g. Reg_)')
+    parser.add_argument("--model-regex", metavar="REGEX", help='get-model writes only variables of which names match REGEX')
+    parser.add_argument("--parallel", metavar="N", type=int, default=1, help='solve post-constraints of independent components in N worker processes (constraints are evaluated in main process)')
+    parser.add_argument("--compile", nargs=2, metavar=("IN_SMT2", "OUT_VGB"), help='compile SMT 2 file to binary format (evaluate OUT_VGB with `vega OUT_VGB`)')
     args = parser.parse_args()
 
+    if args.compile:
+        smt2_file, vgb_file = args.compile
+        with open(smt2_file) as f, open(vgb_file, 'wb') as out:
+            compile_smt2_file(f, out)
+        return
+
+    ### Binary file compiled with --compile
+    if args.file and not args._in:
+        with open(args.file, 'rb') as f:
+            if f.read(len(SCRIPT_MAGIC)) == SCRIPT_MAGIC:
+                f.seek(0)
+                evaluate_binary_file(f, args.profile, args.model_prefix, args.model_regex, args.parallel)
+                return
+
     if args.smt2:
         if args._in:
-            evaluate_smt2_file(sys.stdin, args.profile)
+            evaluate_smt2_file(sys.stdin, args.profile, args.model_prefix, args.model_regex, args.parallel)
         else:
             if args.file:
                 with open(args.file) as f:
-                    evaluate_smt2_file(f, args.profile)
+                    evaluate_smt2_file(f, args.profile, args.model_prefix, args.model_regex, args.parallel)
             else:
                 print("[!] Specify `file`")
                 usage(parser)
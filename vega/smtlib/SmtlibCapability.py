@@ -1,12 +1,12 @@
-from ..AST import Eq, Not
-from ..Writer import FileWriter, StringWriter
+from ..Writer import BufferedWriter, StringWriter
+from .serialize import to_smt2, count_references
 
 class SmtlibCapability:
 
     ### serialize constraints with z3 compatibility
     def to_smt2(self, file=None):
         if file:
-            out = FileWriter(file)
+            out = BufferedWriter(file)
         else:
             out = StringWriter()
 
@@ -31,14 +31,21 @@ class SmtlibCapability:
         for v in self.variables.keys():
             out.write("(declare-fun {} () {})".format(v.name, self.domain.name))
         
+        cache = {} # Rendered subterms waiting for their parents (see vega.smtlib.serialize)
+        counts = count_references(self.constraints)
         for expr in self.constraints:
-            out.write("(assert\n {})".format(expr.to_smt2()))
+            out.write("(assert\n {})".format(to_smt2(expr, cache, counts)))
+        cache = counts = None
 
-        ### Restrict values
+        ### Restrict values (excluded values are computed once per sort)
+        excluded_values = {} # id(sort) -> list of name of values not in sort
         for v in self.variables.keys():
             if v.sort != self.domain: # e.g. sort FileContent
-                for value in self.domain.values - v.sort.values:
-                    out.write("(assert\n {})".format(Not(Eq(v, value)).to_smt2()))
+                names = excluded_values.get(id(v.sort))
+                if names is None:
+                    names = excluded_values[id(v.sort)] = [value.name for value in self.domain.values - v.sort.values]
+                for name in names:
+                    out.write("(assert\n (not (= {} {})))".format(v.name, name))
 
         out.write("(check-sat)")
         
@@ -1,11 +1,15 @@
+import sys
+
 from six.moves import cStringIO
 
 from ..Exceptions import *
-from .parse import parse_cmd, parse_and_get_script_from_file_stream
+from .parse import parse_cmd
+from .vega.VegaAstSmtLibParser import VegaAstSmtLibParser
 from ..Solver import Solver, sat, unsat, unknown
 from ..AST import Sort
 from ..Feature import Feature
 from ..Tactic import Simple2
+from .. import BinaryFormat
 
 def calcuate_domain(sorts):
     domain = set()
@@ -13,8 +17,12 @@ def calcuate_domain(sorts):
         domain |= sort.values
     return Sort('Domain', domain)
 
-def check_sat(expr, s, profile):
-    s.add(*expr)
+### @param parallel: number of worker processes (see Feature(parallel=N))
+def create_solver(sorts, parallel=1):
+    Domain = calcuate_domain(sorts)
+    return Solver(Domain, Feature(tactic=Simple2(), parallel=parallel))
+
+def check_sat(s, profile):
     res = s.check()
     print(res)
 
@@ -23,18 +31,12 @@ def check_sat(expr, s, profile):
 
     return res
 
-def get_model(s):
+### @param prefix, pattern: filter of variable names (see Model.to_smt2())
+def get_model(s, prefix=None, pattern=None):
     m = s.model()
     
     if m.sat == sat:
-        print("(model")
-        for v in m.variables.keys():
-            if len(m[v]) > 1:
-                ans = "(or {})".format(' '.join([x.name for x in m[v]]))
-            else:
-                ans = list(m[v])[0].name
-            print("  (define-fun {name} () {sort_name}\n    (as {ans} {sort_name}))".format(name=v, sort_name=v.sort.name, ans=ans))
-        print(")")
+        m.to_smt2(sys.stdout, prefix=prefix, pattern=pattern)
     
     return m.sat
 
@@ -42,33 +44,61 @@ def error_model_is_not_avaiable(cmd_no):
     print('(error "command #{}: model is not available")'.format(cmd_no))
     exit(1)
 
-def evaluate_smt2_file(file, profile):
-    script = parse_and_get_script_from_file_stream(file)
+### Parses and evaluates script command by command.
+### Solver is created on first assertion and each assertion is evaluated as soon as it is parsed,
+### so that parsed commands are not kept in memory.
+def evaluate_smt2_file(file, profile, model_prefix=None, model_pattern=None, parallel=1):
+    parser = VegaAstSmtLibParser()
+    evaluate_script(parser.iter_script(file), profile, model_prefix, model_pattern, parallel)
+
+### Evaluates script compiled by compile_smt2_file() without SMT-LIB front end
+def evaluate_binary_file(file, profile, model_prefix=None, model_pattern=None, parallel=1):
+    evaluate_script(BinaryFormat.load_script(file), profile, model_prefix, model_pattern, parallel)
 
-    ### Evaluate script
+### Parses SMT-LIB script `smt2_file` and writes it to binary file `out_file` (opened with 'wb')
+def compile_smt2_file(smt2_file, out_file):
+    parser = VegaAstSmtLibParser()
+    BinaryFormat.dump_script(parser.iter_script(smt2_file), out_file)
+
+### @param model_prefix, model_pattern: filter of variables written by get-model (see Model.to_smt2())
+### @param parallel: number of worker processes solving post-constraints of independent components (see Feature(parallel=N))
+def evaluate_script(script, profile, model_prefix=None, model_pattern=None, parallel=1):
     sorts = {}
-    expr = []
     solver = None
     sat = unknown
     for cmd_no, cmd in enumerate(script):
-        if cmd.name in ['declare-datatypes', 'declare-fun', 'assert']:
-            res = parse_cmd(cmd, sorts) # NOTE: Do not replace `sorts` with `{}`. `sorts` passes referrence to `sorts`
-            if res:
-                expr += res
+        if cmd.name in ['declare-datatypes', 'declare-fun']:
+            if cmd.name == 'declare-datatypes' and solver:
+                raise UnhandledCaseError("declare-datatypes after assert is not supported: cmd = {}".format(cmd))
+            parse_cmd(cmd, sorts) # NOTE: Do not replace `sorts` with `{}`. `sorts` passes referrence to `sorts`
+        elif cmd.name in ['assert']:
+            if not solver:
+                solver = create_solver(sorts, parallel)
+            solver.add(*parse_cmd(cmd, sorts))
+            solver.propagate(hold_units=True) # Units are applied in batch
         elif cmd.name in ['check-sat']:
-            ### Initialize solver
-            Domain = calcuate_domain(sorts)
-            solver = Solver(Domain, Feature(tactic=Simple2()))
-
-            sat = check_sat(expr, solver, profile)
+            if not solver:
+                solver = create_solver(sorts, parallel)
+            sat = check_sat(solver, profile)
         elif cmd.name in ['get-model']:
             if not solver:
                 error_model_is_not_avaiable(cmd_no)
-            sat = get_model(solver)
+            sat = get_model(solver, model_prefix, model_pattern)
+        elif cmd.name in ['push']:
+            if not solver:
+                solver = create_solver(sorts, parallel)
+            for _ in range(cmd.args[0]):
+                solver.push()
+        elif cmd.name in ['pop']:
+            if not solver:
+                solver = create_solver(sorts, parallel)
+            for _ in range(cmd.args[0]):
+                solver.pop()
+            sat = unknown
         elif cmd.name in ['set-info']:
             pass
         else:
             raise UnhandledCaseError("cmd = {}".format(cmd))
 
         if sat == unsat:
-            error_model_is_not_avaiable(cmd_no)
\ No newline at end of file
+            error_model_is_not_avaiable(cmd_no)
@@ -5,6 +5,7 @@ from ..Exceptions import *
 from ..AST import *
 from .pysmt.ExtendedSmtLibParser import ExtendedSmtLibParser
 from .vega.VegaSmtLibParser import VegaSmtLibParser
+from .vega.VegaAstSmtLibParser import VegaAstSmtLibParser
 
 def parse_fnode(fnode, sorts, depth=1):
     if fnode.is_and():
@@ -55,8 +56,12 @@ def parse_fnode(fnode, sorts, depth=1):
 
 def parse_cmd(cmd, sorts):
     if cmd.name == 'declare-datatypes':
-        values = [Value(x) for x in cmd.args[0].values]
-        sorts[cmd.args[0].name] = Sort(cmd.args[0].name, values)
+        datatype = cmd.args[0]
+        if isinstance(datatype, Sort): # Built by VegaAstSmtLibParser
+            sorts[datatype.name] = datatype
+        else:
+            values = [Value(x) for x in datatype.values]
+            sorts[datatype.name] = Sort(datatype.name, values)
         return []
     
     if cmd.name == 'declare-fun':
@@ -67,26 +72,33 @@ def parse_cmd(cmd, sorts):
     if cmd.name == 'assert':
         res = []
         for x in cmd.args:
-            res.append(parse_fnode(x, sorts))
+            if isinstance(x, AST): # Built by VegaAstSmtLibParser
+                res.append(x)
+            else:
+                res.append(parse_fnode(x, sorts))
         return res
         # return reduce(lambda r, x: r.append(parse_fnode(x)), cmd.args, [])
 
 ### @public
-def parse_and_get_script_from_file(file_name):
+def parse_and_get_script_from_file(file_name, direct=False):
     with open(file_name) as f:
-        return parse_and_get_script_from_file_stream(f)
+        return parse_and_get_script_from_file_stream(f, direct)
 
 ### @public
-def parse_and_get_script_from_file_stream(f):
+### @arg direct: emit vega AST nodes directly in `assert` commands instead of Fnode
+def parse_and_get_script_from_file_stream(f, direct=False):
     # parser = ExtendedSmtLibParser()
     # return parser.get_script(cStringIO(f.read()))
 
-    parser = VegaSmtLibParser()
+    if direct:
+        parser = VegaAstSmtLibParser()
+    else:
+        parser = VegaSmtLibParser()
     return parser.get_script(f)
 
 ### @public
 def parse_smt2_file(file_name):
-    script = parse_and_get_script_from_file(file_name)
+    script = parse_and_get_script_from_file(file_name, direct=True)
 
     ### Transform to expressions
     sorts = {}
@@ -0,0 +1,132 @@
+from ..AST import *
+
+### Serializes expressions to SMT-LIB without recursion (same output as AST.to_smt2()).
+### Rendered text of each compound node is cached in `cache` (id(node) -> str), so that subterms shared by constraints are rendered once.
+### If `counts` built by count_references() is given, only shared nodes are cached, and text is evicted from `cache`
+### when all references to the node are rendered (i.e. `cache` does not grow to whole rendered output).
+### NOTE: Nodes must be kept alive while `cache` and `counts` are used, since they are keyed by id().
+
+### Compound node class -> operator
+_OPERATORS = {
+    And: "and",
+    Or: "or",
+    Not: "not",
+    If: "ite",
+    Implies: "=>",
+}
+
+def _children(expr):
+    cls = expr.__class__
+    if cls is And or cls is Or:
+        return expr.v
+    if cls is Not:
+        return (expr.v1,)
+    if cls is If:
+        return (expr.cond_clause, expr.then_clause, expr.else_clause)
+    return (expr.left, expr.right) # Implies
+
+### Compound nodes having at most this number of children that are all leaves (e.g. Not(x == a)) are not counted by count_references(),
+### since rendering them again is cheaper than keeping their texts
+MAX_SMALL_CHILDREN = 4
+
+def _isSmall(children):
+    if len(children) > MAX_SMALL_CHILDREN:
+        return False
+    for child in children:
+        if child.__class__ in _OPERATORS:
+            return False
+    return True
+
+def _renderLeaf(expr):
+    if expr.__class__ is Eq and isinstance(expr.v1, Variable) and isinstance(expr.v2, (Variable, Value)):
+        return "(= " + expr.v1.name + " " + expr.v2.name + ")"
+    return expr.to_smt2()
+
+### Counts references to compound nodes from their parents and from `exprs` (each occurrence is counted, and small nodes are skipped)
+### @return dict of id(node) -> number of references for nodes referred more than once
+def count_references(exprs):
+    operators = _OPERATORS
+    counts = {}
+    get = counts.get
+    stack = []
+    push, pop = stack.append, stack.pop
+    for expr in exprs:
+        if not expr.__class__ in operators or _isSmall(_children(expr)):
+            continue
+        n = get(id(expr))
+        if n is not None:
+            counts[id(expr)] = n + 1
+            continue
+        counts[id(expr)] = 1
+        push(expr)
+        while stack:
+            node = pop()
+            cls = node.__class__
+            for child in (node.v if cls is And or cls is Or else _children(node)):
+                if child.__class__ in operators:
+                    child_id = id(child)
+                    n = get(child_id)
+                    if n is None: # Children of node are counted once
+                        if not _isSmall(_children(child)):
+                            counts[child_id] = 1
+                            push(child)
+                    else:
+                        counts[child_id] = n + 1
+    return dict((node_id, n) for node_id, n in counts.items() if n > 1)
+
+### @param counts: references to nodes built by count_references() with expressions including `expr` (or None to cache all nodes)
+### @return str
+def to_smt2(expr, cache=None, counts=None):
+    operators = _OPERATORS
+    if not expr.__class__ in operators:
+        return _renderLeaf(expr)
+    if counts is not None:
+        children = _children(expr)
+        if _isSmall(children): # Not counted (rendered directly)
+            return "(" + operators[expr.__class__] + " " + " ".join([_renderLeaf(child) for child in children]) + ")"
+    if cache is None:
+        cache = {}
+    texts = [] # Rendered operands
+    stack = [expr] # Nodes to be rendered, or (node, number of children) to be joined
+    push, pop = stack.append, stack.pop
+    while stack:
+        node = pop()
+        cls = node.__class__
+        if cls is tuple: # Children are rendered
+            node, n = node
+            k = len(texts) - n
+            text = "(" + operators[node.__class__] + " " + " ".join(texts[k:]) + ")"
+            del texts[k:]
+            node_id = id(node)
+            if counts is None:
+                cache[node_id] = text
+            else:
+                n = counts.get(node_id)
+                if n is not None: # Shared
+                    if n > 1:
+                        counts[node_id] = n - 1
+                        cache[node_id] = text
+                    else:
+                        del counts[node_id]
+            texts.append(text)
+        elif cls in operators:
+            node_id = id(node)
+            text = cache.get(node_id)
+            if text is None:
+                children = _children(node)
+                push((node, len(children)))
+                stack.extend(children[::-1])
+            else:
+                if counts is not None:
+                    n = counts[node_id]
+                    if n > 1:
+                        counts[node_id] = n - 1
+                    else: # Last reference
+                        del counts[node_id]
+                        del cache[node_id]
+                texts.append(text)
+        elif cls is Eq and node.v1.__class__ is Variable and node.v2.__class__ is Value: # Fast path of _renderLeaf()
+            texts.append("(= " + node.v1.name + " " + node.v2.name + ")")
+        else:
+            texts.append(_renderLeaf(node))
+    return texts[0]
@@ -6,7 +6,7 @@ class Fnode:
         self._args = args
 
     def __repr__(self):
-        return "{}({}, {})".format(self.__class__.__name__, self.name, args)
+        return "{}({}, {})".format(self.__class__.__name__, self.name, self._args)
 
     def args(self):
         return self._args
@@ -43,7 +43,7 @@ class Fnode:
 
 class Blank(Fnode):
     def __init__(self):
-        Fnode.__init__(self)
+        Fnode.__init__(self, None, [])
 
 class DataType(Fnode):
     def __init__(self, name, values):
@@ -78,7 +78,7 @@ class BoolConstant(Fnode):
         return "{}({})".format(self.__class__.__name__, self.name)
     
     def constant_value(self):
-        return bool(self.name)
+        return self.name == 'true'
 
     def is_bool_constant(self):
         return True
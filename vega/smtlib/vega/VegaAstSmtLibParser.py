@@ -0,0 +1,59 @@
+from ...Exceptions import UnhandledCaseError
+from ...AST import Sort, Value, Variable, Top, Bot, And, Or, Not, Implies, Eq, If
+from .VegaSmtLibParser import VegaSmtLibParser
+
+### Parser emits vega AST nodes directly (without intermediate Fnode tree).
+### Symbols are resolved against declared datatypes (`self.sorts`) at parse time.
+class VegaAstSmtLibParser(VegaSmtLibParser):
+    def __init__(self):
+        VegaSmtLibParser.__init__(self)
+        self.sorts = {} # name -> Sort
+        self.atoms = {} # symbol name -> Value or Variable
+
+    def declare_symbol(self, name, type_name):
+        VegaSmtLibParser.declare_symbol(self, name, type_name)
+        self.atoms.pop(name, None) # Invalidate resolved symbol
+
+    ### @return Sort
+    def make_datatype(self, name, values):
+        sort = Sort(name, [Value(x) for x in values])
+        self.sorts[name] = sort
+        return sort
+
+    def parse_atom(self, token):
+        atom = self.atoms.get(token)
+        if atom is None:
+            if token == 'true':
+                atom = Top()
+            elif token == 'false':
+                atom = Bot()
+            else:
+                sort = self.sorts[self.symbols[token].name]
+                value = Value(token)
+                if value in sort.values: # Check if symbol is member of datatype
+                    atom = value
+                else:
+                    atom = Variable(token, sort)
+            self.atoms[token] = atom
+        return atom
+
+    def make_blank(self):
+        raise UnhandledCaseError("()")
+
+    def make_fnode(self, name, args):
+        if name == 'and':
+            return And(*args)
+        elif name == 'or':
+            return Or(*args)
+        elif name == 'not':
+            return Not(args[0])
+        elif name == '=>':
+            return Implies(args[0], args[1])
+        elif name == '=':
+            return Eq(args[0], args[1])
+        elif name == 'distinct':
+            return Not(Eq(args[0], args[1]))
+        elif name == 'ite':
+            return If(args[0], args[1], args[2])
+        else:
+            raise UnhandledCaseError("{}: args = {}".format(name, args))
@@ -1,3 +1,5 @@
+import re
+
 from ...Exceptions import ExecutionError
 from .helper import split_script_to_lines
 
@@ -5,110 +7,123 @@ from .Fnode import *
 from .Command import *
 from .SymbolType import SymbolType
 
+### Brackets or atoms (symbols, keywords, numerals)
+TOKENS = re.compile(r'[()]|[^\s()]+')
+
+MAP_NAME_FNODE = {
+    'and': And,
+    'or': Or,
+    'not': Not,
+    '=>': Implies,
+    '=': Equals,
+    'ite': Ite,
+}
+
 class VegaSmtLibParser:
     def __init__(self):
         self.symbols = {}
 
-    def parse_fnode_arg(self, last):
-        last = last.strip(' ')
-        # print("parse_fnode_arg({})".format(last)) # DEBUG
-        if last[0] != '(':
-            if ' ' in last:
-                arg, last = last.split(' ', 1)
-                return arg, last.strip(' ')
-            else:
-                return last, ""
+    def declare_symbol(self, name, type_name):
+        self.symbols[name] = SymbolType(type_name)
+
+    def make_datatype(self, name, values):
+        return DataType(name, values)
+
+    def parse_atom(self, token):
+        if token in ['true', 'false']:
+            return BoolConstant(token)
         else:
-            bracket_depth = 0
-            arg = ""
-            for i, c in enumerate(last):
-                if c == '\r' or c == '\n':
-                    continue
-                arg += c
-                if c == '(':
-                    bracket_depth += 1
-                elif c == ')':
-                    bracket_depth -= 1
-                    if bracket_depth == 0:
-                        # print("arg='{}', last='{}'".format(arg, last[i+1:]))
-                        return arg, last[i+1:].strip(' ')
-        raise ExecutionError('Reached fail through')
+            return Symbol(token, self.symbols[token])
 
-    def parse_fnode(self, line):
-        line = line.strip(' ')
-        if line == "()":
-            return Blank()
-        if line[0] == '(' and line[-1] == ')':
-            line = line[1:-1]
-        # print("parse_fnode({})".format(line)) # DEBUG
-
-        raw_command = line.split(' ', 1)
-        
-        if len(raw_command) == 1:
-            if raw_command[0] in ['true', 'false']:
-                return BoolConstant(raw_command[0])
-            else:
-                symbol_name = raw_command[0]
-                symbol_type = self.symbols[symbol_name]
-                return Symbol(symbol_name, symbol_type)
+    def make_blank(self):
+        return Blank()
+
+    def make_fnode(self, name, args):
+        fnode = MAP_NAME_FNODE.get(name)
+        if fnode:
+            return fnode(name, args)
+        elif name == 'distinct':
+            return Not(name, [Equals(name, args)])
         else:
-            name, last = raw_command
-
-            args = []
-            while last:
-                arg, last = self.parse_fnode_arg(last)
-                args.append(self.parse_fnode(arg))
-            
-            map_name_fnode = {
-                'and': And,
-                'or': Or,
-                'not': Not,
-                '=>': Implies,
-                '=': Equals,
-                'ite': Ite,
-            }
-
-            if name in map_name_fnode:
-                return map_name_fnode[name](name, args)
-            elif name == 'distinct':
-                return Not(name, [Equals(name, args)])
+            return Fnode(name, args)
+
+    ### Parses terms in tokens[i:] until unmatched ')' or end of tokens.
+    ### Walks tokens once with index cursor and explicit stack (no recursion).
+    ### @return (list of Fnode, index of next token)
+    def parse_fnodes(self, tokens, i=0):
+        stack = []
+        args = []
+        n = len(tokens)
+        while i < n:
+            token = tokens[i]
+            i += 1
+            if token == '(':
+                name = tokens[i]
+                if name == ')': # ()
+                    args.append(self.make_blank())
+                    i += 1
+                    continue
+                if name == '(':
+                    raise ExecutionError('Unexpected token: {}'.format(' '.join(tokens)))
+                stack.append((name, args))
+                args = []
+                i += 1
+            elif token == ')':
+                if not stack:
+                    return args, i
+                name, parent_args = stack.pop()
+                parent_args.append(self.make_fnode(name, args))
+                args = parent_args
             else:
-                return Fnode(name, args)
+                args.append(self.parse_atom(token))
+        if stack:
+            raise ExecutionError('Unbalanced brackets: {}'.format(' '.join(tokens)))
+        return args, i
+
+    def parse_fnode(self, line):
+        args, _ = self.parse_fnodes(TOKENS.findall(line))
+        if len(args) != 1:
+            raise ExecutionError('Expected one term: {}'.format(line))
+        return args[0]
 
     def parse_command(self, line):
-        line = line.strip(' ')
-        if line[0] == '(' and line[-1] == ')':
-            line = line[1:-1]
-        
-        if ' ' in line:
-            name, last = line.split(' ', 1)
-            
-            if name in ['set-info']:
-                return Command(name, last.split(' '))
-            
-            elif name == 'declare-datatypes':
-                last_replace_split = last.strip(' ').replace('(', '').replace(')', '').split(' ')
-                datatype_name = last_replace_split[1]
-                datatype_values = last_replace_split[2:]
-                for value in datatype_values:
-                    self.symbols[value] = SymbolType(datatype_name)
-                return Command(name, [DataType(datatype_name, datatype_values)])
-            
-            elif name == 'declare-fun':
-                last_replace_split = last.strip(' ').replace('(', '').replace(')', '').split(' ')
-                symbol_name = last_replace_split[0]
-                symbol_type = last_replace_split[2]
-                self.symbols[symbol_name] = SymbolType(symbol_type)
-                return Command(name, [])
-            else:
-                return Command(name, self.parse_fnode(line).args())
-        
-        else:
-            name = line
+        tokens = TOKENS.findall(line)
+        if len(tokens) < 3 or tokens[0] != '(' or tokens[-1] != ')':
+            raise ExecutionError('Invalid command: {}'.format(line))
+        name = tokens[1]
+
+        if name in ['set-info']:
+            return Command(name, tokens[2:-1])
+
+        elif name in ['push', 'pop']:
+            numerals = tokens[2:-1]
+            if len(numerals) > 1 or not all(x.isdigit() for x in numerals):
+                raise ExecutionError('Invalid command: {}'.format(line))
+            return Command(name, [int(x) for x in numerals] or [1])
+
+        elif name == 'declare-datatypes':
+            atoms = [x for x in tokens[2:-1] if x != '(' and x != ')']
+            datatype_name = atoms[0]
+            datatype_values = atoms[1:]
+            for value in datatype_values:
+                self.declare_symbol(value, datatype_name)
+            return Command(name, [self.make_datatype(datatype_name, datatype_values)])
+
+        elif name == 'declare-fun':
+            atoms = [x for x in tokens[2:-1] if x != '(' and x != ')']
+            symbol_name = atoms[0]
+            symbol_type = atoms[-1]
+            self.declare_symbol(symbol_name, symbol_type)
             return Command(name, [])
 
-    def get_script(self, file):
-        script = []
+        else:
+            args, _ = self.parse_fnodes(tokens, 2)
+            return Command(name, args)
+
+    ### Yields parsed commands one by one
+    def iter_script(self, file):
         for line in split_script_to_lines(file):
-            script.append(self.parse_command(line))
-        return script
\ No newline at end of file
+            yield self.parse_command(line)
+
+    def get_script(self, file):
+        return list(self.iter_script(file))
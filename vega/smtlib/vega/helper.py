@@ -1,25 +1,57 @@
-def split_script_to_lines(file):
+import re
+
+CHUNK_SIZE = 1 << 20 # 1 MiB
+
+### Characters which changes state of scanner
+SPECIAL_CHARACTERS = re.compile(r'[();]')
+
+### Yields top-level commands (i.e. s-expressions) of SMT-LIB script one by one.
+### Reads `file` chunk by chunk, so that memory usage is bounded by size of largest command.
+### Comments are removed and newlines are replaced with spaces.
+def split_script_to_lines(file, chunk_size=CHUNK_SIZE):
     bracket_depth = 0
-    lines = []
-    line = ""
+    pieces = [] # Pieces of current command over chunks
     comment_line = False
-    for c in file.read():
-        if c == ';':
-            comment_line = True
-        elif c == '\r':
-            pass
-        elif c == '\n':
-            line += ' '
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            break
+
+        start = 0 # Start of current command (or its rest) in chunk
+        pos = 0
+        while True:
             if comment_line:
+                end = chunk.find('\n', pos)
+                if end < 0:
+                    start = pos = len(chunk)
+                    break
                 comment_line = False
-                line = ""
-        elif not comment_line:
-            line += c
-            if c == '(':
+                start = pos = end # Keep newline as separator
+
+            m = SPECIAL_CHARACTERS.search(chunk, pos)
+            if m is None:
+                break
+            i = m.start()
+            c = chunk[i]
+            pos = i + 1
+
+            if c == ';':
+                if bracket_depth > 0:
+                    pieces.append(chunk[start:i])
+                comment_line = True
+            elif c == '(':
+                if bracket_depth == 0:
+                    start = i
                 bracket_depth += 1
-            elif c == ')':
+            elif bracket_depth > 0: # c == ')'
                 bracket_depth -= 1
                 if bracket_depth == 0:
-                    lines.append(line)
-                    line = ""
-    return lines
\ No newline at end of file
+                    pieces.append(chunk[start:pos])
+                    yield join_pieces(pieces)
+                    pieces = []
+
+        if bracket_depth > 0 and start < len(chunk):
+            pieces.append(chunk[start:])
+
+def join_pieces(pieces):
+    return ''.join(pieces).replace('\r', '').replace('\n', ' ')